@@ -0,0 +1,107 @@
+"""
+Measure the import cost of SubRenamer's entry points with python -X importtime
+
+Usage:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --modules src.cli --budget-ms 60
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Modules that headless users and the GUI import first
+DEFAULT_MODULES = ['src.cli', 'src.core.file_matcher', 'src.core.match_session',
+                   'src.core.renamer', 'src.core.watcher']
+# Root of the checkout, so the subprocesses can import src
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _import_once(module: str) -> Tuple[int, Dict[str, int]]:
+    """Import a module in a fresh interpreter and return its cumulative and per-module µs.
+
+    Per-module numbers are self times, so the top entries name the imports
+    worth deferring.
+    """
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=_ROOT, capture_output=True, text=True, check=True
+    )
+    total = 0
+    self_times: Dict[str, int] = {}
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            own, cumulative = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue
+        name = fields[2].strip()
+        self_times[name] = own
+        if name == module:
+            total = cumulative
+    return total, self_times
+
+
+def measure(module: str, repeat: int, top: int) -> Dict:
+    """Import a module repeat times and return the median cost and worst imports."""
+    totals: List[int] = []
+    self_times: Dict[str, List[int]] = {}
+    # The first run compiles bytecode and is not counted
+    _import_once(module)
+    for _ in range(repeat):
+        total, times = _import_once(module)
+        totals.append(total)
+        for name, own in times.items():
+            self_times.setdefault(name, []).append(own)
+    heaviest = sorted(((statistics.median(times), name) for name, times in self_times.items()),
+                      reverse=True)[:top]
+    return {
+        'median_us': int(statistics.median(totals)),
+        'min_us': min(totals),
+        'top_imports': [{'module': name, 'self_us': int(own)} for own, name in heaviest],
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modules', nargs='+', default=DEFAULT_MODULES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5,
+                        help='Number of slowest imports listed per module.')
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help='Exit with status 1 if any module takes longer than this.')
+    parser.add_argument('--output', help='Write results as JSON to this file.')
+    args = parser.parse_args(argv)
+
+    results = {}
+    over_budget = []
+    for module in args.modules:
+        result = measure(module, args.repeat, args.top)
+        results[module] = result
+        slowest = ', '.join(f"{entry['module']} {entry['self_us'] / 1000:.1f}"
+                            for entry in result['top_imports'])
+        print(f"{module:<28} {result['median_us'] / 1000:>7.1f} ms  ({slowest})",
+              file=sys.stderr)
+        if args.budget_ms is not None and result['median_us'] > args.budget_ms * 1000:
+            over_budget.append(module)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            f.write(json.dumps({'python': sys.version.split()[0], 'results': results},
+                               indent=2) + '\n')
+    if over_budget:
+        print(f"over the {args.budget_ms} ms budget: {', '.join(over_budget)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
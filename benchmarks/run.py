@@ -0,0 +1,221 @@
+"""
+Benchmark FileMatcher and SubtitleRenamer on synthetic libraries
+
+Usage:
+    python -m benchmarks.run --sizes 1000 10000 --output results/HEAD.json
+    python -m benchmarks.run --compare results/base.json results/HEAD.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.core.dir_snapshot import DirectorySnapshot
+from src.core.file_matcher import FileMatcher
+from src.core.instrumentation import instrumentation
+from src.core.rename_journal import RenameJournal
+from src.core.renamer import SubtitleRenamer
+
+from .synthetic_library import generate_library, remove_library
+
+
+def _measure(work: Callable) -> Tuple[object, float]:
+    """Run work once and return (result, seconds)."""
+    start = time.perf_counter()
+    result = work()
+    return result, time.perf_counter() - start
+
+
+def _peak_memory(work: Callable) -> int:
+    """Run work again under tracemalloc and return its peak traced bytes.
+
+    Tracing slows allocation-heavy code several times over, so it is kept
+    out of the timed run.
+    """
+    tracemalloc.start()
+    try:
+        work()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _accuracy(matches: List[Dict], truth: Dict[str, str]) -> Dict:
+    """Compare produced pairs with the ground truth."""
+    produced = {m['video_file']: m['subtitle_file']
+                for m in matches if m['video_file'] and m['subtitle_file']}
+    correct = sum(1 for video, subtitle in produced.items() if truth.get(video) == subtitle)
+    return {
+        'expected_pairs': len(truth),
+        'produced_pairs': len(produced),
+        'correct_pairs': correct,
+        'precision': correct / len(produced) if produced else 1.0,
+        'recall': correct / len(truth) if truth else 1.0,
+    }
+
+
+def _stage(seconds: float, peak: Optional[int], items: int) -> Dict:
+    return {
+        'seconds': round(seconds, 4),
+        'items_per_second': round(items / seconds, 1) if seconds else None,
+        'peak_memory_bytes': peak,
+    }
+
+
+def run_size(file_count: int, strategy: str, workers: int, seed: int,
+             matcher_options: Optional[Dict] = None, trace_memory: bool = True,
+             journal_path: Optional[str] = None) -> Dict:
+    """Benchmark one library size end to end.
+
+    ``matcher_options`` are passed on to FileMatcher. With ``trace_memory``
+    matching and validation run a second time under tracemalloc. With a
+    ``journal_path`` renames are recorded in a RenameJournal there.
+    """
+    library = generate_library(file_count, seed=seed)
+    instrumentation.reset()
+    try:
+        files = library['files']
+        matcher = FileMatcher(strategy=strategy, **(matcher_options or {}))
+        renamer = SubtitleRenamer(max_workers=workers,
+                                  journal=RenameJournal(journal_path) if journal_path else None)
+
+        matches, match_seconds = _measure(lambda: matcher.match_files(files, verified=True))
+        planned = [m for m in matches if m['subtitle_file'] and m['new_subtitle_name']]
+
+        snapshot = DirectorySnapshot()
+        _, validate_seconds = _measure(
+            lambda: renamer.validate_rename_operation(planned, snapshot)
+        )
+
+        # Matching and validation are read-only and can be repeated for memory;
+        # renames cannot, so their peak is not traced
+        match_peak = validate_peak = None
+        if trace_memory:
+            instrumentation.enabled, stats_enabled = False, instrumentation.enabled
+            match_peak = _peak_memory(lambda: FileMatcher(strategy=strategy, **(matcher_options or {}))
+                                      .match_files(files, verified=True))
+            validate_peak = _peak_memory(
+                lambda: renamer.validate_rename_operation(planned, DirectorySnapshot())
+            )
+            instrumentation.enabled = stats_enabled
+
+        results, rename_seconds = _measure(lambda: renamer.rename_files(planned, snapshot))
+
+        report = {
+            'files': len(files),
+            'match_files': dict(_stage(match_seconds, match_peak, len(files)),
+                                stats=matcher.last_match_stats),
+            'validate_rename_operation': _stage(validate_seconds, validate_peak, len(planned)),
+            'rename_files': dict(_stage(rename_seconds, None, len(planned)),
+                                 failures=sum(1 for r in results if not r['success'])),
+            'accuracy': _accuracy(matches, library['truth']),
+        }
+        if instrumentation.enabled:
+            # SUBRENAMER_STATS=1 adds the per-stage breakdown to the report
+            report['stages'] = {name: {'calls': calls, 'seconds': round(seconds, 4)}
+                                for name, (calls, seconds) in instrumentation.timings.items()}
+            report['counters'] = dict(instrumentation.counters)
+        report['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return report
+    finally:
+        remove_library(library)
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(baseline_path: str, candidate_path: str) -> None:
+    """Print per-stage timing ratios and accuracy changes between two runs."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+
+    print(f"{'size':>8} {'stage':<27} {'base s':>10} {'new s':>10} {'speedup':>8}")
+    for size, new in candidate['results'].items():
+        old = baseline['results'].get(size)
+        if not old:
+            continue
+        for stage in ('match_files', 'validate_rename_operation', 'rename_files'):
+            before, after = old[stage]['seconds'], new[stage]['seconds']
+            speedup = f'{before / after:.2f}x' if after else '-'
+            print(f'{size:>8} {stage:<27} {before:>10.4f} {after:>10.4f} {speedup:>8}')
+        print(f"{size:>8} {'recall':<27} {old['accuracy']['recall']:>10.4f} "
+              f"{new['accuracy']['recall']:>10.4f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--strategy', choices=FileMatcher.STRATEGIES, default='greedy')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='Skip the extra tracemalloc passes for peak memory.')
+    parser.add_argument('--no-episode-keys', action='store_true',
+                        help='Disable episode-key pairing to stress fuzzy scoring.')
+    parser.add_argument('--vector-prefilter', choices=('auto', 'on', 'off'), default='auto',
+                        help='Use of the NumPy n-gram prefilter (default: auto).')
+    parser.add_argument('--match-workers', type=int, default=1,
+                        help='Processes scoring candidate pairs; 0 uses one per CPU (default: 1).')
+    parser.add_argument('--journal', metavar='FILE',
+                        help='Record renames in a rename journal at FILE, to measure its cost. '
+                             'Put it on the disk whose fsync cost matters.')
+    parser.add_argument('--output', help='Write results as JSON to this file.')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'),
+                        help='Compare two saved result files instead of running.')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    matcher_options = {
+        'use_episode_keys': not args.no_episode_keys,
+        'vector_prefilter': {'auto': None, 'on': True, 'off': False}[args.vector_prefilter],
+        'match_workers': args.match_workers or None,
+    }
+    report = {
+        'revision': _git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'strategy': args.strategy,
+        'workers': args.workers,
+        'matcher_options': matcher_options,
+        'journal': bool(args.journal),
+        'results': {},
+    }
+    for size in args.sizes:
+        result = run_size(size, args.strategy, args.workers, args.seed, matcher_options,
+                          trace_memory=not args.no_memory, journal_path=args.journal)
+        report['results'][str(size)] = result
+        print(f"{size:>7} files: match {result['match_files']['seconds']:.3f}s, "
+              f"validate {result['validate_rename_operation']['seconds']:.3f}s, "
+              f"rename {result['rename_files']['seconds']:.3f}s, "
+              f"recall {result['accuracy']['recall']:.3f}", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Synthetic media-library generator with known ground truth
+"""
+
+import os
+import random
+import shutil
+import tempfile
+from typing import Dict, List, Optional
+
+SHOWS = [
+    'Breaking Bad', 'The Office', 'Game of Thrones', 'Dark', 'Friends', 'Lost',
+    'House', 'Fargo', 'The Wire', 'Sherlock', 'Chernobyl', 'Succession',
+    'Better Call Saul', 'Mr Robot', 'The Expanse', 'Severance', 'Mindhunter',
+    'True Detective', 'Westworld', 'Stranger Things', 'Black Mirror', 'Dexter',
+]
+GROUPS = ['NTb', 'FLUX', 'CAKES', 'SuccessfulCrab', 'GalaxyTV', 'KOGi', 'EDITH', 'MeGusta']
+SOURCES = ['1080p.WEB-DL.DDP5.1.H.264', '720p.HDTV.x264', '2160p.WEB.h265', '1080p.BluRay.x264']
+LANGUAGES = ['en', 'zh', 'es', 'fr', 'de']
+SUBTITLE_EXTENSIONS = ['.srt', '.srt', '.srt', '.ass', '.vtt']
+VIDEO_EXTENSIONS = ['.mkv', '.mkv', '.mp4', '.avi']
+ADJECTIVES = ['Silent', 'Broken', 'Northern', 'Hidden', 'Last', 'Golden', 'Crimson', 'Lost',
+              'Wild', 'Iron', 'Quiet', 'Electric', 'Distant', 'Frozen', 'Burning', 'Secret']
+NOUNS = ['Harbor', 'Empire', 'Signal', 'Frontier', 'Kingdom', 'Witness', 'Garden', 'Circuit',
+         'Station', 'Legacy', 'Horizon', 'Protocol', 'Valley', 'Archive', 'Tides', 'Orbit']
+SEASONS_PER_SHOW = 10
+EPISODES_PER_SEASON = 20
+
+
+def default_root() -> str:
+    """Prefer tmpfs so the benchmark measures the code, not the disk."""
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    return tempfile.mkdtemp(prefix='subrenamer-bench-', dir=base)
+
+
+def _show_names(count: int) -> List[str]:
+    """Real titles first, then made-up ones, numbered once those run out."""
+    names = list(SHOWS)
+    names += [f'{adjective} {noun}' for adjective in ADJECTIVES for noun in NOUNS]
+    while len(names) < count:
+        names.append(f'{names[len(names) % 278]} {len(names) // 278 + 1}')
+    return names[:count]
+
+
+def _video_name(rng: random.Random, show: str, year: int, season: int, episode: int) -> str:
+    title = show.replace(' ', '.')
+    if rng.random() < 0.3:
+        title += f'.{year}'
+    return (f'{title}.S{season:02d}E{episode:02d}.{rng.choice(SOURCES)}'
+            f'-{rng.choice(GROUPS)}{rng.choice(VIDEO_EXTENSIONS)}')
+
+
+def _subtitle_name(rng: random.Random, show: str, season: int, episode: int) -> str:
+    style = rng.random()
+    if style < 0.4:
+        stem = f'{show.replace(" ", ".")}.S{season:02d}E{episode:02d}'
+    elif style < 0.7:
+        stem = f'{show} - {season}x{episode:02d}'
+    elif style < 0.85:
+        stem = f'[{rng.choice(GROUPS)}] {show} S{season}E{episode}'
+    else:
+        stem = f'{show.lower().replace(" ", "_")}_s{season:02d}e{episode:02d}'
+    if rng.random() < 0.4:
+        stem += f'.{rng.choice(LANGUAGES)}'
+    return stem + rng.choice(SUBTITLE_EXTENSIONS)
+
+
+def generate_library(file_count: int, root: Optional[str] = None, seed: int = 0,
+                     decoy_ratio: float = 0.1) -> Dict:
+    """Create empty video and subtitle files and return the ground truth.
+
+    About half of the ``file_count`` files are videos with exactly one
+    correct subtitle each. ``decoy_ratio`` of the episodes get a video
+    without a subtitle, a subtitle without a video or a sample clip. Returns a dict with the library
+    ``root``, every created ``files`` path and the ``truth`` mapping of video
+    path to its correct subtitle path.
+    """
+    rng = random.Random(seed)
+    root = root or default_root()
+    files: List[str] = []
+    truth: Dict[str, str] = {}
+
+    # Two files per episode slot, spread over as many shows as needed
+    per_show = SEASONS_PER_SHOW * EPISODES_PER_SEASON
+    shows = _show_names(max(len(SHOWS), file_count // per_show + 1))
+    years = {show: 1980 + rng.randrange(40) for show in shows}
+    slots = [(show, season, episode)
+             for show in shows
+             for season in range(1, SEASONS_PER_SHOW + 1)
+             for episode in range(1, EPISODES_PER_SEASON + 1)]
+    rng.shuffle(slots)
+
+    for show, season, episode in slots:
+        if len(files) >= file_count:
+            break
+        folder = os.path.join(root, show, f'Season {season:02d}')
+        os.makedirs(folder, exist_ok=True)
+
+        video = os.path.join(folder, _video_name(rng, show, years[show], season, episode))
+        subtitle = os.path.join(folder, _subtitle_name(rng, show, season, episode))
+        created = []
+        decoy = rng.random()
+        if decoy < decoy_ratio / 3:
+            subtitle = None  # Video without subtitle
+        elif decoy < decoy_ratio * 2 / 3:
+            video = None  # Orphan subtitle
+        elif decoy < decoy_ratio:
+            # Sample clip sharing the episode's name but not its subtitle
+            created.append(os.path.join(folder, 'sample-' + os.path.basename(video)))
+
+        created.extend(path for path in (video, subtitle) if path)
+        for path in created:
+            open(path, 'w').close()
+        files.extend(created)
+        if video and subtitle:
+            truth[video] = subtitle
+
+    return {'root': root, 'files': files, 'truth': truth}
+
+
+def remove_library(library: Dict) -> None:
+    """Delete a generated library."""
+    shutil.rmtree(library['root'], ignore_errors=True)
@@ -5,7 +5,6 @@ SubRenamer - A macOS application for renaming subtitle files to match video file
 
 import sys
 import os
-from pathlib import Path
 
 # Add current directory to path for imports
 # sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -34,7 +34,10 @@ setup(
     data_files=DATA_FILES,
     options={'py2app': OPTIONS},
     setup_requires=['py2app'],
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
+    entry_points={
+        'console_scripts': ['subrenamer=src.cli:main'],
+    },
     install_requires=[
         'tkinterdnd2',
         'Pillow',
@@ -6,12 +6,11 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from tkinterdnd2 import TkinterDnD
 import os
-from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 
 from .ui.main_window import MainWindow
-from .core.file_matcher import FileMatcher
-from .core.renamer import SubtitleRenamer
+from .core.jobs import BackgroundJob
+from .core.instrumentation import instrumentation
 
 class SubRenamerApp:
     """Main application class."""
@@ -25,28 +24,156 @@ class SubRenamerApp:
         # Set minimum window size
         self.root.minsize(600, 400)
         
-        # Initialize components
-        self.file_matcher = FileMatcher()
-        self.renamer = SubtitleRenamer()
+        # Components are built by a background job once the window is up
+        self.file_matcher = None
+        self.renamer = None
+        self.folder_scanner = None
+        self.match_session = None
+        # Store matched files; the session keeps waiting files indexed between drops
+        self.matched_files: List[Dict] = []
+        
+        # Matching and renaming run in a background job, one at a time
+        self.current_job: Optional[BackgroundJob] = None
+        self.pending_drops: List[List[str]] = []
         
         # Initialize main window
         self.main_window = MainWindow(self.root, self)
+        self._load_components()
+    
+    def _load_components(self) -> None:
+        """Import and build the matching engine without blocking the window.
         
-        # Store matched files
-        self.matched_files: List[Dict] = []
+        Drops arriving before the engine is ready wait in pending_drops. A
+        rename run interrupted in an earlier session is finished first; if
+        that fails the engine is still installed and the error reported.
+        """
+        def work(job: BackgroundJob):
+            job.report_progress(0, 0, "Loading...")
+            from .core.file_matcher import FileMatcher
+            from .core.folder_scanner import FolderScanner
+            from .core.match_session import MatchSession
+            from .core.rename_journal import RenameJournal
+            from .core.renamer import SubtitleRenamer
+            
+            file_matcher = FileMatcher(cache=self._open_cache())
+            renamer = SubtitleRenamer(max_workers=8, journal=RenameJournal())
+            try:
+                recovered = renamer.recover()
+            except Exception as e:
+                # A damaged journal must not leave the app without a matcher
+                recovered = e
+            return (file_matcher, renamer, FolderScanner(file_matcher.supported_extensions),
+                    MatchSession(file_matcher), recovered)
+        
+        self._start_job(work, self._on_components_loaded, "Failed to load the matcher")
     
-    def add_files(self, file_paths: List[str]) -> None:
-        """Add files to the application and match them."""
+    def _on_components_loaded(self, components: Optional[Tuple]) -> None:
+        """Install the engine built by the loading job."""
+        if components is None:
+            return
+        (self.file_matcher, self.renamer, self.folder_scanner, self.match_session,
+         recovered) = components
+        self.matched_files = self.match_session.records
+        if isinstance(recovered, Exception):
+            messagebox.showerror("Error", f"Failed to recover the interrupted rename run: "
+                                          f"{recovered}")
+        elif recovered:
+            failed = [r['original_path'] for r in recovered if not r['success']]
+            message = (f"Finished {len(recovered) - len(failed)} renames interrupted "
+                       f"in the last session.")
+            if failed:
+                message += f"\nFailed files: {', '.join(failed)}"
+            messagebox.showinfo("Recovered", message)
+    
+    @staticmethod
+    def _open_cache():
+        """Open the persistent match cache, or run without one if unavailable."""
+        import sqlite3
+        from .core.match_cache import MatchCache
         try:
-            new_matches = self.file_matcher.match_files(file_paths)
-            self.matched_files.extend(new_matches)
-            self.main_window.update_file_list(self.matched_files)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to process files: {str(e)}")
+            return MatchCache()
+        except (OSError, sqlite3.Error):
+            return None
+    
+    def add_files(self, file_paths: List[str]) -> None:
+        """Add files and folders to the application and match them in the background."""
+        if self.match_session is None and self.current_job is None:
+            # Loading failed; its error was already shown
+            messagebox.showerror("Error", "The matcher is not available. Please restart SubRenamer.")
+            return
+        if self.current_job is not None:
+            # Drops arriving while busy are matched once the current job ends
+            self.pending_drops.append(list(file_paths))
+            return
+        
+        def work(job: BackgroundJob) -> List[Dict]:
+            # Folders are walked lazily and each batch is matched as soon as it is
+            # found; the scanner already filtered and stat'ed every path
+            touched = []
+            found = 0
+            for batch in self.folder_scanner.batches(file_paths):
+                job.check_cancelled()
+                found += len(batch)
+                job.report_progress(found, 0, f"Matching... {found} files found")
+                # Only the new files are scored; waiting rows are completed in place
+                touched.extend(self.match_session.add_files(batch, verified=True))
+            return touched
+        
+        self._start_job(work, self._on_files_matched, "Failed to process files")
+    
+    def _on_files_matched(self, touched: Optional[List[Dict]]) -> None:
+        """Refresh the list once a matching job has finished or was cancelled."""
+        self.main_window.update_file_list(self.matched_files, touched)
+    
+    def cancel_job(self) -> None:
+        """Request cancellation of the running background job."""
+        if self.current_job is not None:
+            self.current_job.cancel()
+            self.main_window.show_cancelling()
+    
+    def _start_job(self, work, on_finished, error_title: str) -> None:
+        """Run work on a background job and route its events back to Tk."""
+        def profiled_work(job: BackgroundJob):
+            with instrumentation.profiled():
+                return work(job)
+        
+        self.current_job = BackgroundJob(profiled_work).start()
+        self.main_window.set_busy(True)
+        self._poll_job(on_finished, error_title)
+    
+    def _poll_job(self, on_finished, error_title: str) -> None:
+        """Drain job events from the Tk main loop until the job ends."""
+        job = self.current_job
+        for event in job.poll():
+            if event.kind == 'progress':
+                self.main_window.show_progress(event.done, event.total, event.message)
+                continue
+            
+            self.current_job = None
+            self.main_window.set_busy(False)
+            if event.kind == 'error':
+                messagebox.showerror("Error", f"{error_title}: {str(event.result)}")
+                if self.match_session is None:
+                    # The engine failed to load, so waiting drops can never be matched
+                    self.pending_drops.clear()
+                # The session may have been partially updated
+                self.main_window.update_file_list(self.matched_files)
+            else:
+                # Cancelled jobs still report whatever they completed
+                on_finished(event.result)
+            # Stats cover the job and the list update that followed it
+            instrumentation.report('background job')
+            
+            if self.pending_drops and self.current_job is None:
+                self.add_files(self.pending_drops.pop(0))
+            return
+        
+        self.root.after(50, self._poll_job, on_finished, error_title)
     
     def clear_files(self) -> None:
         """Clear all files from the list."""
-        self.matched_files.clear()
+        if self.match_session is not None:
+            self.match_session.clear()
         self.main_window.update_file_list(self.matched_files)
     
     def _validate_files(self) -> bool:
@@ -54,9 +181,12 @@ class SubRenamerApp:
         if not self.matched_files:
             return False
             
-        # Count video and subtitle files
-        video_count = sum(1 for match in self.matched_files if match['video_file'] is not None)
-        subtitle_count = sum(1 for match in self.matched_files if match['subtitle_file'] is not None)
+        # Count video files and subtitle sets; a video's language variants count once
+        video_count = len({match.video_file for match in self.matched_files
+                           if match.video_file is not None})
+        subtitle_count = len({match.video_file or match.subtitle_file
+                              for match in self.matched_files
+                              if match.subtitle_file is not None})
         
         # Validation rule 2: Neither can be 0
         if video_count == 0:
@@ -71,14 +201,18 @@ class SubRenamerApp:
         if video_count != subtitle_count:
             messagebox.showerror(
                 "Validation Error", 
-                f"Number of video files ({video_count}) must match number of subtitle files ({subtitle_count})."
+                f"Number of video files ({video_count}) must match number of subtitle files "
+                f"({subtitle_count}, counting the language variants of one video once)."
             )
             return False
             
         return True
     
     def process_rename(self) -> None:
-        """Process the renaming of subtitle files."""
+        """Process the renaming of subtitle files in the background."""
+        if self.current_job is not None:
+            return
+        
         if not self.matched_files:
             messagebox.showwarning("Warning", "No files to process.")
             return
@@ -87,27 +221,87 @@ class SubRenamerApp:
         if not self._validate_files():
             return
         
-        try:
-            results = self.renamer.rename_files(self.matched_files)
-            
-            success_count = sum(1 for r in results if r['success'])
-            total_count = len(results)
-            
-            if success_count == total_count:
-                messagebox.showinfo("Success", f"Successfully renamed {success_count} files.")
-            else:
-                failed_files = [r['original_path'] for r in results if not r['success']]
-                messagebox.showwarning(
-                    "Partial Success", 
-                    f"Renamed {success_count}/{total_count} files.\n"
-                    f"Failed files: {', '.join(failed_files)}"
-                )
-            
-            # Clear the list after processing
-            self.clear_files()
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to rename files: {str(e)}")
+        plan = list(self.matched_files)
+        
+        def work(job: BackgroundJob) -> Tuple[List[Dict], bool]:
+            results = self.renamer.rename_files(
+                plan,
+                progress=lambda done, total: job.report_progress(
+                    done, total, f"Renaming {done}/{total}..."
+                ),
+                should_cancel=lambda: job.cancelled
+            )
+            return results, job.cancelled
+        
+        self._start_job(work, self._on_files_renamed, "Failed to rename files")
+    
+    def _on_files_renamed(self, outcome: Tuple[List[Dict], bool]) -> None:
+        """Report rename results once the job has finished or was cancelled."""
+        results, cancelled = outcome
+        if cancelled:
+            self._on_rename_cancelled(results)
+            return
+        
+        success_count = sum(1 for r in results if r['success'])
+        total_count = len(results)
+        
+        if success_count == total_count:
+            messagebox.showinfo("Success", f"Successfully renamed {success_count} files.")
+        else:
+            failed_files = [r['original_path'] for r in results if not r['success']]
+            messagebox.showwarning(
+                "Partial Success", 
+                f"Renamed {success_count}/{total_count} files.\n"
+                f"Failed files: {', '.join(failed_files)}"
+            )
+        
+        # Clear the list after processing
+        self.clear_files()
+    
+    def _on_rename_cancelled(self, results: List[Dict]) -> None:
+        """Report a cancelled run and keep the rows it did not get to."""
+        attempted = [r for r in results if r['error'] != self.renamer.CANCELLED_ERROR]
+        success_count = sum(1 for r in attempted if r['success'])
+        message = (f"Renaming was cancelled after renaming {success_count} of "
+                   f"{len(results)} files.")
+        failed_files = [r['original_path'] for r in attempted if not r['success']]
+        if failed_files:
+            message += f"\nFailed files: {', '.join(failed_files)}"
+        messagebox.showinfo("Cancelled", message)
+        
+        # Rows that were attempted leave the list as after a full run
+        attempted_paths = {r['original_path'] for r in attempted}
+        self.match_session.discard(match for match in self.matched_files
+                                   if match.subtitle_file in attempted_paths)
+        self.main_window.update_file_list(self.matched_files)
+    
+    def undo_last_rename(self) -> None:
+        """Move the subtitles renamed by the last run back to their old names."""
+        if self.current_job is not None or self.renamer is None:
+            return
+        if not messagebox.askyesno(
+            "Undo", "Move the subtitles renamed in the last run back to their original names?"
+        ):
+            return
+        
+        self._start_job(lambda job: self.renamer.undo_last_run(), self._on_rename_undone,
+                        "Failed to undo the last rename")
+    
+    def _on_rename_undone(self, results: Optional[List[Dict]]) -> None:
+        """Report the outcome of an undo."""
+        if not results:
+            messagebox.showinfo("Undo", "There is nothing to undo.")
+            return
+        
+        failed_files = [r['original_path'] for r in results if not r['success']]
+        if not failed_files:
+            messagebox.showinfo("Undo", f"Restored the original names of {len(results)} files.")
+        else:
+            messagebox.showwarning(
+                "Partial Undo",
+                f"Restored {len(results) - len(failed_files)}/{len(results)} files.\n"
+                f"Failed files: {', '.join(failed_files)}"
+            )
     
     def run(self):
         """Start the application."""
@@ -0,0 +1,259 @@
+"""
+Headless command-line batch mode for SubRenamer
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from typing import Dict, Iterator, List, Optional, TextIO
+
+from .core.dir_snapshot import DirectorySnapshot
+from .core.file_matcher import FileMatcher
+from .core.folder_scanner import DEFAULT_IGNORE_PATTERNS, FolderScanner
+from .core.instrumentation import instrumentation
+from .core.match_cache import MatchCache
+from .core.movie_hash import HashIndex
+from .core.rename_journal import RenameJournal
+from .core.renamer import SubtitleRenamer
+
+# Unattended watch mode only renames confident pairs unless told otherwise;
+# matches the WatchDaemon default
+WATCH_MIN_CONFIDENCE = 0.8
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Create the argument parser for the subrenamer command."""
+    parser = argparse.ArgumentParser(
+        prog='subrenamer',
+        description='Rename subtitle files to match video files. '
+                    'Prints the match plan as JSON lines.'
+    )
+    parser.add_argument('paths', nargs='*',
+                        help='Files or folders to match. Reads one path per line '
+                             'from stdin when omitted or given as "-".')
+
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--apply', action='store_true',
+                      help='Rename the matched subtitle files.')
+    mode.add_argument('--dry-run', action='store_true',
+                      help='Only print the plan (default).')
+    mode.add_argument('--undo', action='store_true',
+                      help='Reverse the last --apply run recorded in the rename journal.')
+
+    parser.add_argument('--min-confidence', type=float, default=None,
+                        help='Skip pairs scoring below this confidence (default: 0, or '
+                             f'{WATCH_MIN_CONFIDENCE} in watch mode, where nobody reviews '
+                             'the plan).')
+    parser.add_argument('--strategy', choices=FileMatcher.STRATEGIES, default='greedy',
+                        help='Matching strategy (default: greedy).')
+    parser.add_argument('--no-episode-keys', action='store_true',
+                        help='Disable exact pairing on parsed episode identifiers.')
+    parser.add_argument('--no-vector-prefilter', action='store_true',
+                        help='Never pick candidates with the NumPy n-gram prefilter.')
+    parser.add_argument('--hash-index', metavar='FILE', default=None,
+                        help='Pair videos with subtitles through a tab-separated file of '
+                             'movie hashes and subtitle paths before name matching.')
+    parser.add_argument('--hash-workers', type=int, default=None,
+                        help='Processes used to hash videos (default: one per CPU).')
+    parser.add_argument('--match-workers', type=int, default=None,
+                        help='Processes scoring candidate pairs of large batches '
+                             '(default: one per CPU).')
+    parser.add_argument('--mode', choices=SubtitleRenamer.MODES, default='move',
+                        help='How --apply gives subtitles their new names: move them, or '
+                             'add a hard or symbolic link and keep the original '
+                             '(default: move).')
+    parser.add_argument('--recover', choices=SubtitleRenamer.RECOVERY_POLICIES, default='resume',
+                        help='Finish (resume) or reverse (rollback) an interrupted --apply '
+                             'run before doing anything else (default: resume).')
+    parser.add_argument('--no-journal', action='store_true',
+                        help='Do not record renames; disables recovery and --undo.')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Concurrent rename operations with --apply (default: 8).')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not read or write the persistent match cache.')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='Empty the persistent match cache before matching.')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and handle new files in the given folders '
+                             'as they appear. Renames only with --apply.')
+    parser.add_argument('--debounce', type=float, default=2.0,
+                        help='Seconds a folder must be quiet before it is matched '
+                             'in watch mode (default: 2).')
+    parser.add_argument('--poll-interval', type=float, default=10.0,
+                        help='Seconds between scans when polling in watch mode (default: 10).')
+    parser.add_argument('--polling', action='store_true',
+                        help='Always poll in watch mode instead of using inotify.')
+    parser.add_argument('--max-depth', type=int, default=None,
+                        help='Maximum folder recursion depth (default: unlimited).')
+    parser.add_argument('--ignore', action='append', default=None, metavar='PATTERN',
+                        help='Ignore file and folder names matching this glob. '
+                             'May be repeated; replaces the default patterns.')
+    parser.add_argument('--stats', action='store_true',
+                        help='Print stage timings and counters to stderr when done '
+                             '(also enabled by SUBRENAMER_STATS=1).')
+    parser.add_argument('--profile', metavar='FILE', default=None,
+                        help='Write a cProfile dump for pstats to FILE; implies --stats.')
+    return parser
+
+
+def _read_paths(paths: List[str], stdin: TextIO) -> Iterator[str]:
+    """Yield paths from the command line, expanding "-" to stdin lines."""
+    for path in paths or ['-']:
+        if path == '-':
+            for line in stdin:
+                line = line.rstrip('\n')
+                if line:
+                    yield line
+        else:
+            yield path
+
+
+def _min_confidence(args: argparse.Namespace) -> float:
+    """The confidence threshold given, or the default for the current mode."""
+    if args.min_confidence is not None:
+        return args.min_confidence
+    return WATCH_MIN_CONFIDENCE if args.watch else 0.0
+
+
+def _plan_entry(match: Dict, min_confidence: float) -> Dict:
+    """Describe one match record as a JSON-ready plan entry."""
+    if not match['video_file'] or not match['subtitle_file']:
+        action = 'unmatched'
+    elif match['confidence'] < min_confidence:
+        action = 'skip'
+    elif match['subtitle_file'] == match['new_subtitle_name']:
+        action = 'keep'
+    else:
+        action = 'rename'
+    return dict(match, type='match', action=action)
+
+
+def _emit(entry: Dict, out: TextIO) -> None:
+    """Write a single JSON line and flush so consumers can stream it."""
+    out.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    out.flush()
+
+
+def _open_cache(args: argparse.Namespace) -> Optional[MatchCache]:
+    """Open the persistent match cache, or run without one if unavailable."""
+    if args.no_cache:
+        return None
+    try:
+        cache = MatchCache()
+        if args.clear_cache:
+            cache.invalidate()
+        return cache
+    except (OSError, sqlite3.Error) as e:
+        sys.stderr.write(f'subrenamer: running without the match cache: {e}\n')
+        return None
+
+
+def _build_renamer(args: argparse.Namespace) -> SubtitleRenamer:
+    """Create the renamer, journaling its runs unless disabled."""
+    return SubtitleRenamer(max_workers=args.workers, mode=args.mode,
+                           journal=None if args.no_journal else RenameJournal(),
+                           recovery=args.recover)
+
+
+def _emit_results(results: List[Dict], kind: str, out: TextIO) -> int:
+    """Print rename results and return the number that failed."""
+    failed = 0
+    for result in results:
+        failed += not result['success']
+        _emit(dict(result, type=kind), out)
+    return failed
+
+
+def _watch(args: argparse.Namespace, matcher: FileMatcher, scanner: FolderScanner,
+           renamer: SubtitleRenamer, stdout: TextIO) -> int:
+    """Run watch mode until interrupted."""
+    # ctypes and select are only needed in watch mode
+    from .core.watcher import WatchDaemon
+
+    roots = [path for path in args.paths if os.path.isdir(path)]
+    if not roots:
+        sys.stderr.write('subrenamer: --watch needs at least one folder\n')
+        return 2
+
+    daemon = WatchDaemon(
+        roots, matcher, renamer, scanner,
+        apply=args.apply, min_confidence=_min_confidence(args),
+        debounce=args.debounce, poll_interval=args.poll_interval,
+        use_inotify=not args.polling
+    )
+    try:
+        daemon.run(lambda entry: _emit(entry, stdout))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main(argv: Optional[List[str]] = None, stdin: TextIO = sys.stdin,
+         stdout: TextIO = sys.stdout) -> int:
+    """Run the command-line interface and return the process exit code."""
+    args = build_parser().parse_args(argv)
+    if args.stats or args.profile:
+        instrumentation.configure(True, args.profile or instrumentation.profile_path)
+
+    try:
+        with instrumentation.profiled():
+            return _run(args, stdin, stdout)
+    finally:
+        instrumentation.report('watch' if args.watch else 'apply' if args.apply
+                               else 'undo' if args.undo else 'dry run')
+
+
+def _run(args: argparse.Namespace, stdin: TextIO, stdout: TextIO) -> int:
+    """Match the given paths and print, and optionally apply, the plan."""
+    if args.undo and args.no_journal:
+        sys.stderr.write('subrenamer: --undo needs the rename journal; drop --no-journal\n')
+        return 2
+    renamer = _build_renamer(args)
+    if args.undo:
+        return 1 if _emit_results(renamer.undo_last_run(), 'undo', stdout) else 0
+    if args.apply:
+        # Settle an interrupted run before its files are matched again
+        _emit_results(renamer.recover(), 'recovered', stdout)
+
+    cache = _open_cache(args)
+    matcher = FileMatcher(strategy=args.strategy,
+                          use_episode_keys=not args.no_episode_keys,
+                          vector_prefilter=False if args.no_vector_prefilter else None,
+                          hash_index=HashIndex(args.hash_index) if args.hash_index else None,
+                          hash_workers=args.hash_workers,
+                          match_workers=args.match_workers,
+                          cache=cache)
+    scanner = FolderScanner(
+        matcher.supported_extensions,
+        max_depth=args.max_depth,
+        ignore_patterns=DEFAULT_IGNORE_PATTERNS if args.ignore is None else args.ignore
+    )
+
+    if args.watch:
+        return _watch(args, matcher, scanner, renamer, stdout)
+
+    matches = matcher.match_files(scanner.scan(_read_paths(args.paths, stdin)), verified=True)
+
+    accepted = []
+    for match in matches:
+        entry = _plan_entry(match, _min_confidence(args))
+        if entry['action'] == 'rename':
+            accepted.append(match)
+        _emit(entry, stdout)
+
+    if not args.apply:
+        return 0
+
+    snapshot = DirectorySnapshot()
+    validation = renamer.validate_rename_operation(accepted, snapshot)
+    _emit(dict(validation, type='validation'), stdout)
+    if not validation['valid']:
+        return 1
+
+    return 1 if _emit_results(renamer.rename_files(accepted, snapshot), 'result', stdout) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Maximum-weight bipartite assignment over sparse video/subtitle score graphs
+"""
+
+import heapq
+from typing import Dict, Hashable, List, Tuple
+
+# Sparse score graph: row -> {column: weight}
+ScoreGraph = Dict[Hashable, Dict[Hashable, float]]
+
+
+def connected_components(graph: ScoreGraph) -> List[ScoreGraph]:
+    """Split a sparse score graph into independent connected components."""
+    parent: Dict[Tuple[int, Hashable], Tuple[int, Hashable]] = {}
+
+    def find(node):
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    # Rows and columns live in separate namespaces so equal keys never merge
+    for row, columns in graph.items():
+        parent.setdefault((0, row), (0, row))
+        for column in columns:
+            parent.setdefault((1, column), (1, column))
+            parent[find((1, column))] = find((0, row))
+
+    components: Dict[Tuple[int, Hashable], ScoreGraph] = {}
+    for row, columns in graph.items():
+        components.setdefault(find((0, row)), {})[row] = columns
+    return list(components.values())
+
+
+def max_weight_assignment(graph: ScoreGraph) -> Dict[Hashable, Hashable]:
+    """Return the row -> column assignment with the largest total weight.
+
+    Rows may stay unassigned when that yields a better total. The problem is
+    solved per connected component with successive shortest augmenting paths
+    on the sparse graph, so cost follows the number of scored pairs rather
+    than the full rows x columns matrix.
+    """
+    assignment: Dict[Hashable, Hashable] = {}
+    for component in connected_components(graph):
+        assignment.update(_solve_component(component))
+    return assignment
+
+
+def _solve_component(graph: ScoreGraph) -> Dict[Hashable, Hashable]:
+    """Solve one connected component of the assignment problem."""
+    if len(graph) == 1:
+        (row, columns), = graph.items()
+        if not columns:
+            return {}
+        # max() keeps the first column on ties, matching a linear scan
+        return {row: max(columns, key=columns.get)}
+
+    # Convert to a min-cost problem with non-negative costs. Every row also
+    # gets a private "unassigned" column so a perfect row matching exists.
+    ceiling = max((w for columns in graph.values() for w in columns.values()), default=0.0)
+    costs: Dict[Hashable, List[Tuple[Tuple[int, Hashable], float]]] = {}
+    for row, columns in graph.items():
+        edges = [((0, column), ceiling - weight) for column, weight in columns.items()]
+        edges.append(((1, row), ceiling))
+        costs[row] = edges
+
+    row_potential = {row: 0.0 for row in graph}
+    column_potential: Dict[Tuple[int, Hashable], float] = {}
+    row_of_column: Dict[Tuple[int, Hashable], Hashable] = {}
+    column_of_row: Dict[Hashable, Tuple[int, Hashable]] = {}
+
+    for root in graph:
+        # Dijkstra over reduced costs until the first free column is reached
+        settled: Dict[Tuple[int, Hashable], float] = {}
+        reached_from: Dict[Tuple[int, Hashable], Hashable] = {}
+        tentative: Dict[Tuple[int, Hashable], float] = {}
+        row_distance = {root: 0.0}
+        heap: List[Tuple[float, int, Tuple[int, Hashable], Hashable]] = []
+        counter = 0
+
+        def relax(row, distance):
+            nonlocal counter
+            for column, cost in costs[row]:
+                if column in settled:
+                    continue
+                reduced = cost - row_potential[row] - column_potential.get(column, 0.0)
+                candidate = distance + reduced
+                if candidate < tentative.get(column, float('inf')):
+                    tentative[column] = candidate
+                    counter += 1
+                    heapq.heappush(heap, (candidate, counter, column, row))
+
+        relax(root, 0.0)
+        free_column = None
+        while heap:
+            distance, _, column, row = heapq.heappop(heap)
+            if column in settled:
+                continue
+            settled[column] = distance
+            reached_from[column] = row
+            if column not in row_of_column:
+                free_column = column
+                break
+            next_row = row_of_column[column]
+            row_distance[next_row] = distance
+            relax(next_row, distance)
+
+        # The private column of the root is always reachable
+        shortest = settled[free_column]
+        for column, distance in settled.items():
+            column_potential[column] = column_potential.get(column, 0.0) - (shortest - distance)
+        for row, distance in row_distance.items():
+            row_potential[row] += shortest - distance
+
+        # Flip the augmenting path
+        column = free_column
+        while True:
+            row = reached_from[column]
+            previous = column_of_row.get(row)
+            row_of_column[column] = row
+            column_of_row[row] = column
+            if row == root:
+                break
+            column = previous
+
+    return {
+        row: column[1]
+        for row, column in column_of_row.items()
+        if column[0] == 0
+    }
@@ -0,0 +1,126 @@
+"""
+In-memory directory snapshots for rename existence and permission checks
+"""
+
+import os
+import sys
+import threading
+from typing import Dict, Optional, Set
+
+from .instrumentation import instrumentation
+
+
+class DirectorySnapshot:
+    """Lists each involved directory once and answers file checks from memory.
+
+    A snapshot is meant to live for one validate-and-rename pass: it reflects
+    the directories as they were first listed plus the renames recorded
+    through it, not changes made by other programs in the meantime.
+    """
+
+    def __init__(self, case_insensitive: Optional[bool] = None):
+        # macOS and Windows volumes compare names case-insensitively by default
+        if case_insensitive is None:
+            case_insensitive = sys.platform in ('darwin', 'win32')
+        self.case_insensitive = case_insensitive
+        self.directories_listed = 0
+        self._listings: Dict[str, Optional[Set[str]]] = {}
+        self._writable: Dict[str, bool] = {}
+        self._planned: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, path: str) -> str:
+        """Return the comparison key for a file name or path."""
+        return path.casefold() if self.case_insensitive else path
+
+    def _listing(self, directory: str) -> Optional[Set[str]]:
+        """Return the cached names in a directory, listing it on first use.
+
+        None means the directory exists but cannot be listed, in which case
+        callers fall back to a direct stat.
+        """
+        directory = directory or os.curdir
+        with self._lock:
+            if directory in self._listings:
+                return self._listings[directory]
+            try:
+                names = {self._key(name) for name in os.listdir(directory)}
+            except (FileNotFoundError, NotADirectoryError):
+                names = set()
+            except OSError:
+                names = None
+            self.directories_listed += 1
+            instrumentation.count('syscall.listdir')
+            self._listings[directory] = names
+            return names
+
+    def exists(self, path: str) -> bool:
+        """Check whether a file exists in the snapshot."""
+        directory, name = os.path.split(path)
+        listing = self._listing(directory)
+        if listing is None:
+            return os.path.exists(path)
+        return self._key(name) in listing
+
+    def is_writable(self, directory: str) -> bool:
+        """Check whether files can be created in a directory.
+
+        Directories that do not exist yet are judged by their nearest
+        existing parent, since renaming creates them on demand.
+        """
+        directory = directory or os.curdir
+        with self._lock:
+            if directory in self._writable:
+                return self._writable[directory]
+
+        probe = directory
+        while not os.path.isdir(probe):
+            parent = os.path.dirname(probe)
+            if not parent or parent == probe:
+                break
+            probe = parent
+        writable = os.access(probe, os.W_OK)
+        instrumentation.count('syscall.access')
+
+        with self._lock:
+            self._writable[directory] = writable
+        return writable
+
+    def plan(self, original_path: str, new_path: str) -> Optional[str]:
+        """Reserve a rename target for this batch.
+
+        Returns the source that already claimed the same target, or None
+        when the target was still free.
+        """
+        target = self._key(new_path)
+        with self._lock:
+            claimed_by = self._planned.get(target)
+            if claimed_by is not None and claimed_by != original_path:
+                return claimed_by
+            self._planned[target] = original_path
+            return None
+
+    def is_same_file_name(self, original_path: str, new_path: str) -> bool:
+        """Whether two paths name the same file under this snapshot's case rules."""
+        return self._key(original_path) == self._key(new_path)
+
+    def record_rename(self, original_path: str, new_path: str) -> None:
+        """Update the cached listings after a file was moved."""
+        for path, present in ((original_path, False), (new_path, True)):
+            self._record(path, present)
+
+    def record_created(self, path: str) -> None:
+        """Update the cached listing after a link or copy was created."""
+        self._record(path, True)
+
+    def _record(self, path: str, present: bool) -> None:
+        """Add a name to, or drop it from, its directory's cached listing."""
+        directory, name = os.path.split(path)
+        listing = self._listing(directory)
+        if listing is None:
+            return
+        with self._lock:
+            if present:
+                listing.add(self._key(name))
+            else:
+                listing.discard(self._key(name))
@@ -0,0 +1,115 @@
+"""
+Episode identifier parsing for exact video/subtitle pairing
+"""
+
+import os
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+# S01E02, s1e2, S01.E02
+_SEASON_EPISODE = re.compile(r'(?<![a-z0-9])s(\d{1,2})[ ._-]?e(\d{1,4})(?!\d)', re.IGNORECASE)
+# 1x02 (resolutions like 1920x1080 are excluded by the digit look-behind)
+_CROSS = re.compile(r'(?<![a-z0-9])(\d{1,2})x(\d{2,3})(?!\d)', re.IGNORECASE)
+# Absolute numbering: "Show - 012", "Ep12", "Episode 12", "E012"
+_ABSOLUTE = re.compile(
+    r'(?:(?<![a-z0-9])(?:episode|ep|e)[ ._-]?|\s-\s)(\d{1,3})(?:v\d)?(?![\dp])',
+    re.IGNORECASE
+)
+_TAGS = re.compile(r'\[.*?\]|\(.*?\)|\{.*?\}')
+_YEAR = re.compile(r'(?<!\d)(?:19|20)\d{2}(?!\d)')
+_SEPARATORS = re.compile(r'[\s._-]+')
+
+
+class EpisodeInfo(NamedTuple):
+    """Episode identifiers parsed from a file name."""
+    show: str
+    season: Optional[int]
+    episode: Optional[int]
+    absolute: Optional[int]
+
+    def key(self, scope: str) -> Tuple:
+        """Return the join key of this episode within a show or directory scope."""
+        if self.season is not None:
+            return ('se', scope, self.season, self.episode)
+        return ('abs', scope, self.absolute)
+
+    def same_show(self, other: 'EpisodeInfo') -> bool:
+        """Whether two show names may refer to the same show.
+
+        A missing show name, or one name containing the other (such as
+        "office" and "the office us"), counts as the same show.
+        """
+        return not self.show or not other.show or self.show in other.show or other.show in self.show
+
+    def conflicts_with(self, other: 'EpisodeInfo') -> bool:
+        """Whether two files clearly belong to different episodes."""
+        if self.season is not None and other.season is not None:
+            return (self.season, self.episode) != (other.season, other.episode)
+        if self.absolute is not None and other.absolute is not None:
+            return self.absolute != other.absolute
+        return False
+
+
+def _clean_show(prefix: str) -> str:
+    """Normalize the show-name part preceding an episode identifier."""
+    prefix = _TAGS.sub(' ', prefix)
+    prefix = _YEAR.sub(' ', prefix)
+    return _SEPARATORS.sub(' ', prefix).strip(' -').lower()
+
+
+@lru_cache(maxsize=65536)
+def parse_episode(filename: str) -> Optional[EpisodeInfo]:
+    """Parse show, season, episode and absolute number from a file name."""
+    name = os.path.splitext(os.path.basename(filename))[0]
+
+    for pattern in (_SEASON_EPISODE, _CROSS):
+        match = pattern.search(name)
+        if match:
+            return EpisodeInfo(_clean_show(name[:match.start()]),
+                               int(match.group(1)), int(match.group(2)), None)
+
+    # Bracket tags often hold CRCs and resolutions, so only look outside them
+    untagged = _TAGS.sub(lambda m: ' ' * len(m.group(0)), name)
+    match = _ABSOLUTE.search(untagged)
+    if match:
+        return EpisodeInfo(_clean_show(name[:match.start()]), None, None, int(match.group(1)))
+
+    return None
+
+
+def join_by_episode(video_files: List[str], subtitle_files: List[str],
+                    parse: Callable[[str], Optional[EpisodeInfo]] = parse_episode) -> Dict[str, str]:
+    """Pair videos and subtitles whose episode identifiers match exactly.
+
+    Files are joined through a dict keyed on (show, season, episode) or
+    (show, absolute) first, then on the same identifiers within a directory
+    for names whose show parts differ only in spelling. Only keys held by
+    exactly one video and one subtitle are paired; everything else is left
+    for fuzzy matching.
+    """
+    pairs: Dict[str, str] = {}
+    videos = [(v, parse(v)) for v in video_files]
+    subtitles = [(s, parse(s)) for s in subtitle_files]
+    infos = dict(videos + subtitles)
+
+    for scope_of in (lambda path, info: info.show, lambda path, info: os.path.dirname(path)):
+        paired_subtitles = set(pairs.values())
+        video_keys: Dict[Hashable, List[str]] = defaultdict(list)
+        subtitle_keys: Dict[Hashable, List[str]] = defaultdict(list)
+        for video_file, info in videos:
+            if info and video_file not in pairs:
+                video_keys[info.key(scope_of(video_file, info))].append(video_file)
+        for subtitle_file, info in subtitles:
+            if info and subtitle_file not in paired_subtitles:
+                subtitle_keys[info.key(scope_of(subtitle_file, info))].append(subtitle_file)
+
+        for key, keyed_videos in video_keys.items():
+            keyed_subtitles = subtitle_keys.get(key)
+            if len(keyed_videos) == 1 and keyed_subtitles and len(keyed_subtitles) == 1:
+                video_file, subtitle_file = keyed_videos[0], keyed_subtitles[0]
+                if infos[video_file].same_show(infos[subtitle_file]):
+                    pairs[video_file] = subtitle_file
+
+    return pairs
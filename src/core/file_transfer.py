@@ -0,0 +1,211 @@
+"""
+Device-aware moves, verified kernel copies and link output modes for renaming
+"""
+
+import errno
+import os
+import shutil
+import threading
+from typing import Dict, Set
+
+from .instrumentation import instrumentation
+
+# How a subtitle is put under its new name; the link modes keep the original in place
+TRANSFER_MODES = ('move', 'hardlink', 'symlink')
+# Bytes requested per copy_file_range/sendfile call; the kernel may copy less
+_COPY_CHUNK = 1 << 30
+_COMPARE_CHUNK = 1 << 16
+# copy_file_range and sendfile report these when a pair of files is unsupported
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP,
+                errno.EBADF, errno.ENOTSOCK}
+
+
+class DeviceMap:
+    """Caches the device of each directory, so st_dev is read once per directory."""
+
+    def __init__(self):
+        self._devices: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def device_of(self, directory: str):
+        """Identify the device holding a directory, falling back to its path.
+
+        A directory that does not exist yet is judged by its nearest
+        existing parent, where it would be created.
+        """
+        directory = directory or os.curdir
+        with self._lock:
+            if directory in self._devices:
+                return self._devices[directory]
+
+        device = directory
+        probe = directory
+        while probe:
+            instrumentation.count('syscall.stat')
+            try:
+                device = os.stat(probe).st_dev
+                break
+            except OSError:
+                parent = os.path.dirname(probe)
+                if parent == probe:
+                    break
+                probe = parent
+
+        with self._lock:
+            self._devices[directory] = device
+        return device
+
+    def same_device(self, first_directory: str, second_directory: str) -> bool:
+        """Whether two directories live on the same device."""
+        return self.device_of(first_directory) == self.device_of(second_directory)
+
+
+def _copy_range(source_fd: int, target_fd: int, size: int) -> int:
+    """Copy size bytes in the kernel where possible and return the bytes copied."""
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copied < size:
+                sent = os.copy_file_range(source_fd, target_fd, min(_COPY_CHUNK, size - copied),
+                                          copied, copied)
+                if sent == 0:
+                    break
+                copied += sent
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+    if copied < size and hasattr(os, 'sendfile'):
+        try:
+            os.lseek(target_fd, copied, os.SEEK_SET)
+            while copied < size:
+                sent = os.sendfile(target_fd, source_fd, copied, min(_COPY_CHUNK, size - copied))
+                if sent == 0:
+                    break
+                copied += sent
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+    if copied < size:
+        # Userspace copy for platforms and filesystems without either call
+        os.lseek(source_fd, copied, os.SEEK_SET)
+        os.lseek(target_fd, copied, os.SEEK_SET)
+        while True:
+            chunk = os.read(source_fd, _COMPARE_CHUNK)
+            if not chunk:
+                break
+            os.write(target_fd, chunk)
+            copied += len(chunk)
+    return copied
+
+
+def kernel_copy(source: str, target: str) -> int:
+    """Copy a file's contents and timestamps and flush them to disk.
+
+    Uses copy_file_range, then sendfile, then plain reads and writes,
+    whichever the platform and filesystems support. Returns the bytes copied.
+    """
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        copied = _copy_range(src.fileno(), dst.fileno(), os.fstat(src.fileno()).st_size)
+        os.fsync(dst.fileno())
+    shutil.copystat(source, target)
+    return copied
+
+
+def same_contents(first: str, second: str) -> bool:
+    """Compare two files byte for byte."""
+    with open(first, 'rb') as a, open(second, 'rb') as b:
+        if os.fstat(a.fileno()).st_size != os.fstat(b.fileno()).st_size:
+            return False
+        while True:
+            chunk = a.read(_COMPARE_CHUNK)
+            if chunk != b.read(_COMPARE_CHUNK):
+                return False
+            if not chunk:
+                return True
+
+
+def temporary_path(target: str) -> str:
+    """Name of the partial copy made while moving a file to target."""
+    directory, name = os.path.split(target)
+    return os.path.join(directory, f'.{name}.subrenamer-part')
+
+
+class FileTransfer:
+    """Puts files under new names according to an output mode.
+
+    In 'move' mode files on the same device are renamed atomically with
+    os.replace; files crossing devices are copied in the kernel, verified,
+    renamed into place and only then removed from their old location.
+    'hardlink' and 'symlink' leave the original name in place, for
+    libraries that must keep seeding under the downloaded names.
+    One instance serves a single rename pass and may be shared by threads.
+    """
+
+    def __init__(self, mode: str = 'move', verify_copies: bool = True):
+        if mode not in TRANSFER_MODES:
+            raise ValueError(f"Unknown output mode: {mode}")
+        self.mode = mode
+        # Compare copied files with their source before the source is removed
+        self.verify_copies = verify_copies
+        self.devices = DeviceMap()
+        self._ready_directories: Set[str] = set()
+
+    def transfer(self, source: str, target: str) -> str:
+        """Put source under the target name and return the method used.
+
+        The method is 'rename', 'copy', 'hardlink' or 'symlink'. Raises
+        OSError on failure, with the source still in place.
+        """
+        target_dir = os.path.dirname(target)
+        self._ensure_directory(target_dir)
+
+        if self.mode == 'symlink':
+            # Relative links keep working when the whole library is moved
+            os.symlink(os.path.relpath(source, target_dir or os.curdir), target)
+            instrumentation.count('syscall.symlink')
+            return 'symlink'
+
+        same_device = self.devices.same_device(os.path.dirname(source), target_dir)
+        if self.mode == 'hardlink':
+            if not same_device:
+                raise OSError(errno.EXDEV, "Hard links cannot cross devices")
+            os.link(source, target)
+            instrumentation.count('syscall.link')
+            return 'hardlink'
+
+        if same_device:
+            try:
+                os.replace(source, target)
+                instrumentation.count('syscall.rename')
+                return 'rename'
+            except OSError as e:
+                # Bind mounts share a device number but still refuse renames
+                if e.errno != errno.EXDEV:
+                    raise
+        self._copy_across(source, target)
+        return 'copy'
+
+    def _ensure_directory(self, directory: str) -> None:
+        """Create a target directory once per pass rather than once per file."""
+        if not directory or directory in self._ready_directories:
+            return
+        os.makedirs(directory, exist_ok=True)
+        instrumentation.count('syscall.mkdir')
+        self._ready_directories.add(directory)
+
+    def _copy_across(self, source: str, target: str) -> None:
+        """Move a file to another device through a verified temporary copy."""
+        temporary = temporary_path(target)
+        try:
+            kernel_copy(source, temporary)
+            if self.verify_copies and not same_contents(source, temporary):
+                raise OSError(errno.EIO, f"Copy verification failed: {os.path.basename(target)}")
+            os.replace(temporary, target)
+        except BaseException:
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+            raise
+        os.unlink(source)
+        instrumentation.count('rename.cross_device')
@@ -0,0 +1,139 @@
+"""
+Stage timings, counters and optional cProfile dumps for diagnosing slow runs
+"""
+
+import contextlib
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, TextIO
+
+# Set to 1 to print a per-run summary of stage timings and counters
+STATS_ENV = 'SUBRENAMER_STATS'
+# Set to a file path to also write a cProfile dump, readable with pstats
+PROFILE_ENV = 'SUBRENAMER_PROFILE'
+
+_DISABLED_STAGE = contextlib.nullcontext()
+
+
+class _Stage:
+    """Times one execution of a named stage."""
+
+    __slots__ = ('_owner', '_name', '_start')
+
+    def __init__(self, owner: 'Instrumentation', name: str):
+        self._owner = owner
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._owner.add_time(self._name, time.perf_counter() - self._start)
+        return False
+
+
+class Instrumentation:
+    """Collects per-stage call counts, timings and event counters.
+
+    While disabled, ``stage`` returns a shared no-op context manager and
+    ``count`` returns immediately, so hooks can stay in place permanently.
+    Hooks sit at stage granularity, never inside per-pair loops.
+    """
+
+    def __init__(self, enabled: bool = False, profile_path: Optional[str] = None):
+        self.enabled = False
+        self.profile_path: Optional[str] = None
+        self.timings: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._profiler = None
+        self.configure(enabled, profile_path)
+
+    @classmethod
+    def from_environment(cls, environ=os.environ) -> 'Instrumentation':
+        """Build an instance configured from SUBRENAMER_STATS/SUBRENAMER_PROFILE."""
+        enabled = environ.get(STATS_ENV, '').lower() not in ('', '0', 'false', 'no')
+        return cls(enabled, environ.get(PROFILE_ENV) or None)
+
+    def configure(self, enabled: bool = False, profile_path: Optional[str] = None) -> None:
+        """Switch collection on or off; a profile path implies enabled."""
+        self.enabled = enabled or bool(profile_path)
+        self.profile_path = profile_path
+        self._profiler = None
+
+    def stage(self, name: str):
+        """Context manager timing one execution of a stage."""
+        if not self.enabled:
+            return _DISABLED_STAGE
+        return _Stage(self, name)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        """Record one call of a stage that took the given time."""
+        with self._lock:
+            entry = self.timings.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Add to an event counter such as candidates scored or stat calls."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextlib.contextmanager
+    def profiled(self):
+        """Run the block under cProfile when a profile path is configured.
+
+        Profiles accumulate across blocks and the dump is rewritten after
+        each one. Only the calling thread is profiled.
+        """
+        if not self.profile_path:
+            yield
+            return
+        if self._profiler is None:
+            import cProfile
+            self._profiler = cProfile.Profile()
+        self._profiler.enable()
+        try:
+            yield
+        finally:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_path)
+
+    def reset(self) -> None:
+        """Forget all timings and counters."""
+        with self._lock:
+            self.timings.clear()
+            self.counters.clear()
+
+    def summary(self, title: str = 'run') -> str:
+        """Format the collected timings and counters as a table."""
+        with self._lock:
+            timings = sorted(self.timings.items())
+            counters = sorted(self.counters.items())
+        lines = [f'SubRenamer stats: {title}',
+                 f"  {'stage':<32} {'calls':>8} {'total s':>10} {'mean ms':>10}"]
+        for name, (calls, seconds) in timings:
+            lines.append(f'  {name:<32} {calls:>8} {seconds:>10.4f} {seconds / calls * 1000:>10.3f}')
+        if counters:
+            lines.append(f"  {'counter':<32} {'value':>8}")
+            for name, value in counters:
+                lines.append(f'  {name:<32} {value:>8}')
+        if self.profile_path:
+            lines.append(f'  profile written to {self.profile_path}')
+        return '\n'.join(lines)
+
+    def report(self, title: str = 'run', stream: Optional[TextIO] = None) -> None:
+        """Print the summary, if enabled, and start a new run."""
+        if not self.enabled:
+            return
+        print(self.summary(title), file=stream or sys.stderr)
+        self.reset()
+
+
+# Shared instance used by the matcher, renamer, scanner and UI hooks
+instrumentation = Instrumentation.from_environment()
@@ -0,0 +1,98 @@
+"""
+Background jobs with progress reporting and cooperative cancellation
+"""
+
+import queue
+import threading
+from typing import Any, Callable, List, NamedTuple, Optional
+
+
+class JobEvent(NamedTuple):
+    """A message sent from a running job to its subscriber.
+
+    ``kind`` is one of 'progress', 'done', 'error' or 'cancelled'. Progress
+    events carry ``done``/``total`` counts and a message, 'done' events carry
+    the job's return value and 'error' events the raised exception.
+    """
+    kind: str
+    done: int = 0
+    total: int = 0
+    message: str = ''
+    result: Any = None
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work function when cancellation was requested."""
+
+
+class BackgroundJob:
+    """Runs a work function on a worker thread and streams events to a queue.
+
+    The work function receives the job itself and should call
+    ``report_progress`` and ``check_cancelled`` at convenient checkpoints.
+    Events are only ever read through ``poll``, so a GUI can drain them
+    from its own thread, for example from a Tk ``after`` callback.
+    """
+
+    def __init__(self, work: Callable[['BackgroundJob'], Any], name: str = 'job'):
+        self.work = work
+        self.name = name
+        self.events: 'queue.Queue[JobEvent]' = queue.Queue()
+        self._cancel_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'BackgroundJob':
+        """Start the work function on a daemon thread."""
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        try:
+            result = self.work(self)
+        except JobCancelled:
+            self.events.put(JobEvent('cancelled'))
+        except Exception as e:
+            self.events.put(JobEvent('error', result=e))
+        else:
+            if self.cancelled:
+                self.events.put(JobEvent('cancelled', result=result))
+            else:
+                self.events.put(JobEvent('done', result=result))
+
+    def cancel(self) -> None:
+        """Ask the work function to stop at its next checkpoint."""
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether cancellation has been requested."""
+        return self._cancel_event.is_set()
+
+    @property
+    def running(self) -> bool:
+        """Whether the worker thread is still alive."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def check_cancelled(self) -> None:
+        """Raise JobCancelled if cancellation has been requested."""
+        if self.cancelled:
+            raise JobCancelled()
+
+    def report_progress(self, done: int, total: int = 0, message: str = '') -> None:
+        """Send a progress event; a total of 0 means the total is unknown."""
+        self.events.put(JobEvent('progress', done, total, message))
+
+    def poll(self) -> List[JobEvent]:
+        """Return every event queued since the last poll without blocking."""
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Block until the worker thread finishes."""
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,299 @@
+"""
+Persistent SQLite cache of normalized names, episode features and pairings
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from .episode_parser import EpisodeInfo, parse_episode
+
+# (size, mtime in nanoseconds) identifying one version of a file
+FileKey = Tuple[int, int]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    normalized TEXT NOT NULL,
+    episode TEXT,
+    last_used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_last_used ON files (last_used);
+CREATE TABLE IF NOT EXISTS pairs (
+    video_path TEXT PRIMARY KEY,
+    video_size INTEGER NOT NULL,
+    video_mtime_ns INTEGER NOT NULL,
+    subtitle_path TEXT NOT NULL,
+    subtitle_size INTEGER NOT NULL,
+    subtitle_mtime_ns INTEGER NOT NULL,
+    confidence REAL NOT NULL,
+    last_used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pairs_subtitle ON pairs (subtitle_path);
+CREATE INDEX IF NOT EXISTS pairs_last_used ON pairs (last_used);
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    movie_hash TEXT NOT NULL,
+    last_used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hashes_last_used ON hashes (last_used);
+"""
+
+# SQLite limits the number of bound parameters per statement
+_CHUNK = 500
+
+
+def default_cache_path() -> str:
+    """Return the platform's per-user data location for the cache file."""
+    if sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Application Support')
+    elif sys.platform == 'win32':
+        base = os.environ.get('APPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+    return os.path.join(base, 'SubRenamer', 'match_cache.sqlite3')
+
+
+def file_keys(paths: Iterable[str]) -> Dict[str, FileKey]:
+    """Stat files and return their (size, mtime) keys, skipping missing ones."""
+    keys = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        keys[path] = (st.st_size, st.st_mtime_ns)
+    return keys
+
+
+def _chunks(items, size: int = _CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class FileFeatures:
+    """Per-call view of file features: cached values first, computed on a miss.
+
+    Misses are remembered in ``fresh`` so they can be written back to the
+    cache once matching is done.
+    """
+
+    def __init__(self, normalize: Callable[[str], str], keys: Optional[Dict[str, FileKey]] = None,
+                 cached: Optional[Dict[str, Tuple[str, Optional[EpisodeInfo]]]] = None):
+        self._normalize = normalize
+        self.keys = keys or {}
+        self.features = dict(cached or {})
+        self.fresh: Dict[str, Tuple[str, Optional[EpisodeInfo]]] = {}
+
+    def _get(self, path: str) -> Tuple[str, Optional[EpisodeInfo]]:
+        found = self.features.get(path)
+        if found is None:
+            found = (self._normalize(path), parse_episode(path))
+            self.features[path] = found
+            self.fresh[path] = found
+        return found
+
+    def name(self, path: str) -> str:
+        """Normalized name of a file."""
+        return self._get(path)[0]
+
+    def episode(self, path: str) -> Optional[EpisodeInfo]:
+        """Parsed episode identifiers of a file."""
+        return self._get(path)[1]
+
+
+class MatchCache:
+    """Caches per-file matching work keyed by (path, size, mtime).
+
+    Entries are evicted least-recently-used once more than ``max_entries``
+    files or pairs are stored. A cache written by a different matcher
+    version is cleared on open; movie hashes depend only on file contents
+    and survive version changes.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 500000):
+        self.path = path or default_cache_path()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        import sqlite3
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Jobs may use the cache from a worker thread; access is serialized
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(_SCHEMA)
+
+    def check_version(self, version: str) -> None:
+        """Clear the cache if it was written by a different matcher version."""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+            if row and row[0] == version:
+                return
+            self._conn.execute('DELETE FROM files')
+            self._conn.execute('DELETE FROM pairs')
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES ('version', ?)", (version,)
+            )
+
+    def lookup_files(self, keys: Dict[str, FileKey]) -> Dict[str, Tuple[str, Optional[EpisodeInfo]]]:
+        """Return cached (normalized name, episode info) for unchanged files."""
+        found = {}
+        with self._lock, self._conn:
+            for chunk in _chunks(keys):
+                rows = self._conn.execute(
+                    'SELECT path, size, mtime_ns, normalized, episode FROM files '
+                    f'WHERE path IN ({",".join("?" * len(chunk))})', chunk
+                ).fetchall()
+                for path, size, mtime_ns, normalized, episode in rows:
+                    if keys[path] == (size, mtime_ns):
+                        info = EpisodeInfo(*json.loads(episode)) if episode else None
+                        found[path] = (normalized, info)
+            self._touch('files', 'path', found)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def store_files(self, entries: Dict[str, Tuple[str, Optional[EpisodeInfo]]],
+                    keys: Dict[str, FileKey]) -> None:
+        """Store normalized names and episode info for files with known keys."""
+        now = int(time.time())
+        rows = [
+            (path, *keys[path], normalized, json.dumps(list(info)) if info else None, now)
+            for path, (normalized, info) in entries.items()
+            if path in keys
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO files '
+                '(path, size, mtime_ns, normalized, episode, last_used) VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            self._evict('files', 'path')
+
+    def lookup_pairs(self, keys: Dict[str, FileKey],
+                     video_paths: Optional[Iterable[str]] = None) -> Dict[str, Tuple[str, float]]:
+        """Return accepted pairings whose video and subtitle are both unchanged.
+
+        Only pairings of ``video_paths`` (default: every key) are looked up;
+        ``keys`` must hold the current keys of the videos and subtitles.
+        """
+        found = {}
+        video_paths = keys if video_paths is None else [v for v in video_paths if v in keys]
+        with self._lock, self._conn:
+            for chunk in _chunks(video_paths):
+                rows = self._conn.execute(
+                    'SELECT video_path, video_size, video_mtime_ns, subtitle_path, '
+                    'subtitle_size, subtitle_mtime_ns, confidence FROM pairs '
+                    f'WHERE video_path IN ({",".join("?" * len(chunk))})', chunk
+                ).fetchall()
+                for video, v_size, v_mtime, subtitle, s_size, s_mtime, confidence in rows:
+                    if keys[video] == (v_size, v_mtime) and keys.get(subtitle) == (s_size, s_mtime):
+                        found[video] = (subtitle, confidence)
+            self._touch('pairs', 'video_path', found)
+        return found
+
+    def store_pairs(self, pairs: Dict[str, Tuple[str, float]], keys: Dict[str, FileKey]) -> None:
+        """Remember accepted pairings, replacing older pairings of either file."""
+        now = int(time.time())
+        rows = [
+            (video, *keys[video], subtitle, *keys[subtitle], confidence, now)
+            for video, (subtitle, confidence) in pairs.items()
+            if video in keys and subtitle in keys
+        ]
+        with self._lock, self._conn:
+            for chunk in _chunks(row[3] for row in rows):
+                self._conn.execute(
+                    f'DELETE FROM pairs WHERE subtitle_path IN ({",".join("?" * len(chunk))})',
+                    chunk
+                )
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO pairs (video_path, video_size, video_mtime_ns, '
+                'subtitle_path, subtitle_size, subtitle_mtime_ns, confidence, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            self._evict('pairs', 'video_path')
+
+    def lookup_hashes(self, keys: Dict[str, FileKey]) -> Dict[str, str]:
+        """Return cached movie hashes of unchanged files."""
+        found = {}
+        with self._lock, self._conn:
+            for chunk in _chunks(keys):
+                rows = self._conn.execute(
+                    'SELECT path, size, mtime_ns, movie_hash FROM hashes '
+                    f'WHERE path IN ({",".join("?" * len(chunk))})', chunk
+                ).fetchall()
+                for path, size, mtime_ns, value in rows:
+                    if keys[path] == (size, mtime_ns):
+                        found[path] = value
+            self._touch('hashes', 'path', found)
+        return found
+
+    def store_hashes(self, hashes: Dict[str, str], keys: Dict[str, FileKey]) -> None:
+        """Store movie hashes for files with known keys."""
+        now = int(time.time())
+        rows = [(path, *keys[path], value, now) for path, value in hashes.items() if path in keys]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO hashes (path, size, mtime_ns, movie_hash, last_used) '
+                'VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+            self._evict('hashes', 'path')
+
+    def invalidate(self, paths: Optional[Iterable[str]] = None) -> None:
+        """Forget the given files, or everything when no paths are given."""
+        with self._lock, self._conn:
+            if paths is None:
+                self._conn.execute('DELETE FROM files')
+                self._conn.execute('DELETE FROM pairs')
+                self._conn.execute('DELETE FROM hashes')
+                return
+            for chunk in _chunks(paths):
+                marks = ",".join("?" * len(chunk))
+                self._conn.execute(f'DELETE FROM files WHERE path IN ({marks})', chunk)
+                self._conn.execute(f'DELETE FROM hashes WHERE path IN ({marks})', chunk)
+                self._conn.execute(
+                    f'DELETE FROM pairs WHERE video_path IN ({marks}) OR subtitle_path IN ({marks})',
+                    chunk + chunk
+                )
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def _touch(self, table: str, column: str, paths: Iterable[str]) -> None:
+        """Mark entries as recently used. Caller holds the lock."""
+        now = int(time.time())
+        self._conn.executemany(
+            f'UPDATE {table} SET last_used = ? WHERE {column} = ?',
+            ((now, path) for path in paths)
+        )
+
+    def _evict(self, table: str, column: str) -> None:
+        """Drop least-recently-used entries above max_entries. Caller holds the lock."""
+        count = self._conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                f'DELETE FROM {table} WHERE {column} IN '
+                f'(SELECT {column} FROM {table} ORDER BY last_used LIMIT ?)',
+                (excess,)
+            )
@@ -0,0 +1,139 @@
+"""
+Compact match records with a dict-compatible view
+"""
+
+import itertools
+import os
+import sys
+from collections.abc import Mapping
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Keys of the dict view, in the order match dicts have always used
+RECORD_KEYS = ('video_file', 'subtitle_file', 'new_subtitle_name', 'confidence')
+# Source of row identities; never reused within a process, unlike id()
+_row_ids = itertools.count(1)
+
+
+def _split_path(path: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Split a path into its interned directory prefix and its basename."""
+    if path is None:
+        return None, None
+    name = os.path.basename(path)
+    return sys.intern(path[:len(path) - len(name)]), name
+
+
+def rename_plan(matches: Iterable[Mapping]) -> List[Tuple[str, str]]:
+    """The (subtitle, new name) pairs of the matches that name a new subtitle.
+
+    Match records are read through their attributes; plain match dicts
+    still work through their keys.
+    """
+    plan = []
+    for match in matches:
+        if type(match) is MatchRecord:
+            subtitle_file, new_name = match.subtitle_file, match.new_subtitle_name
+        else:
+            subtitle_file, new_name = match['subtitle_file'], match['new_subtitle_name']
+        if subtitle_file and new_name:
+            plan.append((subtitle_file, new_name))
+    return plan
+
+
+class MatchRecord(Mapping):
+    """One row of a match plan, readable and writable like the old match dict.
+
+    ``record['video_file']``, ``dict(record)`` and ``record.update(...)``
+    behave as they did for dicts with the keys in RECORD_KEYS; code that
+    scans many records can read the attributes of the same names instead.
+
+    Each path is kept as an interned directory prefix plus a basename, so
+    rows in one folder share the directory part, and views showing names
+    read ``video_basename``, ``subtitle_basename`` and
+    ``new_subtitle_basename`` without building anything. The full new
+    name is built on first use and kept until it changes.
+
+    ``row_id`` identifies the record for its whole life, for views that
+    keep one display row per record; it is not part of the dict view.
+    """
+
+    __slots__ = ('_video_dir', 'video_basename', '_subtitle_dir', 'subtitle_basename',
+                 '_new_dir', 'new_subtitle_basename', '_new_path', 'confidence', 'row_id')
+
+    def __init__(self, video_file: Optional[str] = None, subtitle_file: Optional[str] = None,
+                 new_subtitle_name: Optional[str] = None, confidence: float = 0.0):
+        self.row_id = next(_row_ids)
+        self.set_pair(video_file, subtitle_file, new_subtitle_name, confidence)
+
+    @property
+    def video_file(self) -> Optional[str]:
+        if self.video_basename is None:
+            return None
+        return self._video_dir + self.video_basename
+
+    @video_file.setter
+    def video_file(self, path: Optional[str]) -> None:
+        self._video_dir, self.video_basename = _split_path(path)
+
+    @property
+    def subtitle_file(self) -> Optional[str]:
+        if self.subtitle_basename is None:
+            return None
+        return self._subtitle_dir + self.subtitle_basename
+
+    @subtitle_file.setter
+    def subtitle_file(self, path: Optional[str]) -> None:
+        self._subtitle_dir, self.subtitle_basename = _split_path(path)
+
+    @property
+    def new_subtitle_name(self) -> Optional[str]:
+        path = self._new_path
+        if path is None and self.new_subtitle_basename is not None:
+            path = self._new_path = self._new_dir + self.new_subtitle_basename
+        return path
+
+    @new_subtitle_name.setter
+    def new_subtitle_name(self, path: Optional[str]) -> None:
+        self._new_dir, self.new_subtitle_basename = _split_path(path)
+        self._new_path = None
+
+    def set_pair(self, video_file: Optional[str], subtitle_file: Optional[str],
+                 new_subtitle_name: Optional[str], confidence: float) -> None:
+        """Set every field at once."""
+        self.video_file = video_file
+        self.subtitle_file = subtitle_file
+        self.new_subtitle_name = new_subtitle_name
+        self.confidence = confidence
+
+    def __getitem__(self, key: str):
+        # Spelled out rather than using getattr; this is the hot path of the dict view
+        if key == 'video_file':
+            return self.video_file
+        if key == 'subtitle_file':
+            return self.subtitle_file
+        if key == 'new_subtitle_name':
+            return self.new_subtitle_name
+        if key == 'confidence':
+            return self.confidence
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value) -> None:
+        if key not in RECORD_KEYS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def update(self, other=(), **fields) -> None:
+        """Set several fields, like dict.update."""
+        for key, value in dict(other, **fields).items():
+            self[key] = value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(RECORD_KEYS)
+
+    def __len__(self) -> int:
+        return len(RECORD_KEYS)
+
+    def __contains__(self, key) -> bool:
+        return key in RECORD_KEYS
+
+    def __repr__(self) -> str:
+        return f'MatchRecord({dict(self)!r})'
@@ -0,0 +1,360 @@
+"""
+Incremental matching state kept across successive drops
+"""
+
+import os
+from collections import defaultdict
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from .assignment import max_weight_assignment
+from .episode_parser import parse_episode
+from .file_matcher import FileMatcher
+from .instrumentation import instrumentation
+from .match_record import MatchRecord
+from .subtitle_index import SubtitleIndex
+from .subtitle_variants import split_variant, unique_name
+
+
+class MatchSession:
+    """Keeps unmatched videos and subtitles indexed between drops.
+
+    Each call to ``add_files`` only scores the newly added files against the
+    files still waiting for a partner, and pairs them by updating the
+    existing rows of ``records`` in place rather than rematching everything.
+    """
+
+    def __init__(self, file_matcher: FileMatcher):
+        self.file_matcher = file_matcher
+        # Match records in display order; the list object itself never changes
+        self.records: List[MatchRecord] = []
+        self.last_match_stats: Dict[str, int] = {}
+        self._reset_state()
+
+    def _reset_state(self) -> None:
+        """Forget every file seen so far."""
+        self._known_paths: Set[str] = set()
+        # (size, mtime) of every file, kept only when the matcher has a cache
+        self._file_keys: Dict[str, Tuple[int, int]] = {}
+        # Rows holding a video or subtitle that still has no partner
+        self._video_rows: Dict[str, MatchRecord] = {}
+        self._subtitle_rows: Dict[str, MatchRecord] = {}
+        self._video_index = SubtitleIndex()
+        self._subtitle_index = SubtitleIndex()
+        # Episode key -> unmatched files, for the show and directory scopes
+        self._video_keys: Dict[Hashable, List[str]] = defaultdict(list)
+        self._subtitle_keys: Dict[Hashable, List[str]] = defaultdict(list)
+        # Language/flag variants: base path -> first subtitle, which is matched
+        # on behalf of the later ones that follow it to its video
+        self._variant_first: Dict[str, str] = {}
+        self._variant_followers: Dict[str, List[str]] = defaultdict(list)
+        self._variant_video: Dict[str, Tuple[str, float]] = {}
+        self._follower_rows: Dict[str, MatchRecord] = {}
+        # Case-folded new names already given out, per video
+        self._targets: Dict[str, Set[str]] = defaultdict(set)
+
+    def clear(self) -> None:
+        """Remove all files from the session."""
+        self.records.clear()
+        self._reset_state()
+
+    def discard(self, rows: Iterable[MatchRecord]) -> None:
+        """Remove paired rows, for example once their subtitles were renamed.
+
+        Their files are forgotten unless another row still shows them, so
+        dropping them again adds them anew. Rows still waiting for a
+        partner are kept, since the indexes refer to them.
+        """
+        discarded = {row.row_id for row in rows if row.video_file and row.subtitle_file}
+        if not discarded:
+            return
+        removed = [row for row in self.records if row.row_id in discarded]
+        self.records[:] = [row for row in self.records if row.row_id not in discarded]
+        shown = {path for row in self.records for path in (row.video_file, row.subtitle_file)}
+        for row in removed:
+            for path in (row.video_file, row.subtitle_file):
+                if path not in shown:
+                    self._known_paths.discard(path)
+
+    def add_files(self, file_paths: Iterable[str], verified: bool = False) -> List[MatchRecord]:
+        """Add files, pair them with waiting files, and return the touched rows."""
+        matcher = self.file_matcher
+        with instrumentation.stage('match.split'):
+            video_files, subtitle_files = matcher.split_files(
+                (p for p in file_paths if p not in self._known_paths), verified
+            )
+        # Drop duplicates inside this batch as well
+        video_files = list(dict.fromkeys(video_files))
+        subtitle_files = list(dict.fromkeys(subtitle_files))
+        self._known_paths.update(video_files)
+        self._known_paths.update(subtitle_files)
+        subtitle_files, new_followers = self._split_variants(subtitle_files)
+
+        with instrumentation.stage('match.cache_lookup'):
+            features = matcher.load_features(video_files + subtitle_files)
+        self._file_keys.update(features.keys)
+        with instrumentation.stage('match.index'):
+            for video_file in video_files:
+                self._video_index.add(video_file, features.name(video_file))
+            for subtitle_file in subtitle_files:
+                self._subtitle_index.add(subtitle_file, features.name(subtitle_file))
+
+        with instrumentation.stage('match.cache_lookup'):
+            pairs = self._cached_pairs(video_files)
+        if matcher.use_episode_keys:
+            with instrumentation.stage('match.episode_join'):
+                paired_subtitles = {subtitle_file for subtitle_file, _ in pairs.values()}
+                pairs.update(self._pair_by_episode(
+                    [v for v in video_files if v not in pairs],
+                    [s for s in subtitle_files if s not in paired_subtitles]
+                ))
+
+        scored_before = self._video_index.candidates_scored + self._subtitle_index.candidates_scored
+        with instrumentation.stage('match.score'):
+            if matcher.strategy == 'optimal':
+                fuzzy = self._pair_optimal(video_files, subtitle_files, pairs)
+            else:
+                fuzzy = self._pair_greedy(video_files, subtitle_files, pairs)
+        pairs.update(fuzzy)
+
+        with instrumentation.stage('match.apply'):
+            touched = self._apply_pairs(pairs, video_files, subtitle_files)
+            touched.extend(self._apply_variants(pairs, new_followers))
+        with instrumentation.stage('match.cache_store'):
+            matcher.store_features(features, pairs)
+        self.last_match_stats = {
+            'new_files': len(video_files) + len(subtitle_files),
+            'pairs': len(pairs),
+            'candidates_scored': (self._video_index.candidates_scored
+                                  + self._subtitle_index.candidates_scored),
+            'candidates_pruned': (self._video_index.candidates_pruned
+                                  + self._subtitle_index.candidates_pruned),
+        }
+        instrumentation.count('match.new_files', len(video_files) + len(subtitle_files))
+        instrumentation.count('match.candidates_scored',
+                              self.last_match_stats['candidates_scored'] - scored_before)
+        instrumentation.count('syscall.stat', len(features.keys))
+        return touched
+
+    def _split_variants(self, subtitle_files: List[str]) -> Tuple[List[str], List[str]]:
+        """Separate new subtitles into group leaders and variants of known groups."""
+        leaders = []
+        followers = []
+        for subtitle_file in subtitle_files:
+            first = self._variant_first.setdefault(split_variant(subtitle_file)[0], subtitle_file)
+            if first == subtitle_file:
+                leaders.append(subtitle_file)
+            else:
+                self._variant_followers[first].append(subtitle_file)
+                followers.append(subtitle_file)
+        return leaders, followers
+
+    def _apply_variants(self, pairs: Dict[str, Tuple[str, float]],
+                        new_followers: List[str]) -> List[MatchRecord]:
+        """Give variants the video of their group, or a waiting row until it has one."""
+        touched = []
+        for video_file, (subtitle_file, confidence) in pairs.items():
+            self._variant_video[subtitle_file] = (video_file, confidence)
+            for follower in self._variant_followers.get(subtitle_file, ()):
+                row = self._follower_rows.pop(follower, None)
+                if row is not None:
+                    self._fill_row(row, video_file, follower, confidence)
+                    touched.append(row)
+
+        for follower in new_followers:
+            first = self._variant_first[split_variant(follower)[0]]
+            if first in self._variant_video:
+                video_file, confidence = self._variant_video[first]
+                row = MatchRecord()
+                self.records.append(row)
+                self._fill_row(row, video_file, follower, confidence)
+                touched.append(row)
+            elif follower not in self._follower_rows:
+                self._add_waiting_row(None, follower, self._follower_rows, touched)
+        return touched
+
+    def _cached_pairs(self, video_files: List[str]) -> Dict[str, Tuple[str, float]]:
+        """Reuse cached pairings of new videos with subtitles still waiting."""
+        cache = self.file_matcher.cache
+        if cache is None:
+            return {}
+        pairs = {}
+        used_subtitles = set()
+        for video_file, (subtitle_file, confidence) in cache.lookup_pairs(
+                self._file_keys, video_files).items():
+            if subtitle_file in self._subtitle_index.names and subtitle_file not in used_subtitles:
+                used_subtitles.add(subtitle_file)
+                pairs[video_file] = (subtitle_file, confidence)
+        return pairs
+
+    def _pair_by_episode(self, video_files: List[str],
+                         subtitle_files: List[str]) -> Dict[str, Tuple[str, float]]:
+        """Pair new files through the persistent episode-key dicts."""
+        pairs = {}
+        new_files = set(video_files).union(subtitle_files)
+        touched_keys = []
+        for keys, files in ((self._video_keys, video_files), (self._subtitle_keys, subtitle_files)):
+            for file_path in files:
+                for key in self._episode_keys(file_path):
+                    keys[key].append(file_path)
+                    touched_keys.append(key)
+
+        # Show-scoped keys are tried before directory-scoped ones
+        touched_keys.sort(key=lambda key: key[0] != 'show')
+        for key in dict.fromkeys(touched_keys):
+            videos = self._video_keys.get(key, ())
+            subtitles = self._subtitle_keys.get(key, ())
+            if len(videos) != 1 or len(subtitles) != 1:
+                continue
+            video_file, subtitle_file = videos[0], subtitles[0]
+            # Two waiting files are left alone; only arrivals are matched
+            if video_file not in new_files and subtitle_file not in new_files:
+                continue
+            if parse_episode(video_file).same_show(parse_episode(subtitle_file)):
+                pairs[video_file] = (subtitle_file, 1.0)
+                self._forget_keys(video_file, subtitle_file)
+        return pairs
+
+    @staticmethod
+    def _episode_keys(file_path: str) -> List[Tuple]:
+        """Return the show- and directory-scoped episode keys of a file."""
+        info = parse_episode(file_path)
+        if not info:
+            return []
+        return [('show',) + info.key(info.show),
+                ('dir',) + info.key(os.path.dirname(file_path))]
+
+    def _forget_keys(self, video_file: str, subtitle_file: str) -> None:
+        """Remove a newly paired video and subtitle from the episode-key dicts."""
+        for keys, file_path in ((self._video_keys, video_file), (self._subtitle_keys, subtitle_file)):
+            for key in self._episode_keys(file_path):
+                files = keys.get(key)
+                if files and file_path in files:
+                    files.remove(file_path)
+                    if not files:
+                        del keys[key]
+
+    def _score(self, video_file: str, subtitle_file: str) -> float:
+        """Score a pair using the names cached in the session indexes."""
+        return self.file_matcher._score_pair(
+            video_file, self._video_index.names[video_file],
+            subtitle_file, self._subtitle_index.names[subtitle_file]
+        )
+
+    def _delta_graph(self, video_files: List[str], subtitle_files: List[str],
+                     pairs: Dict) -> Dict[str, Dict[str, float]]:
+        """Score every pair involving at least one new, still unpaired file."""
+        paired_subtitles = {subtitle_file for subtitle_file, _ in pairs.values()}
+        graph: Dict[str, Dict[str, float]] = defaultdict(dict)
+        new_videos = [v for v in video_files if v not in pairs]
+        new_subtitles = [s for s in subtitle_files if s not in paired_subtitles]
+        # Large drops pick candidates with the n-gram prefilter, as match_files does;
+        # choices from earlier drops are stale once other files have arrived
+        self._subtitle_index.preselected.clear()
+        self._video_index.preselected.clear()
+        self.file_matcher._preselect(new_videos, self._subtitle_index,
+                                     self._video_index.names.__getitem__)
+        self.file_matcher._preselect(new_subtitles, self._video_index,
+                                     self._subtitle_index.names.__getitem__)
+
+        for video_file in new_videos:
+            video_name = self._video_index.names[video_file]
+            for subtitle_file in self._subtitle_index.candidates(video_name, paired_subtitles):
+                score = self._score(video_file, subtitle_file)
+                if score > 0.5:  # Minimum threshold
+                    graph[video_file][subtitle_file] = score
+
+        new_video_set = set(video_files)
+        paired_videos = set(pairs)
+        for subtitle_file in new_subtitles:
+            subtitle_name = self._subtitle_index.names[subtitle_file]
+            for video_file in self._video_index.candidates(subtitle_name, paired_videos):
+                if video_file in new_video_set:
+                    continue  # Already scored above
+                score = self._score(video_file, subtitle_file)
+                if score > 0.5:  # Minimum threshold
+                    graph[video_file][subtitle_file] = score
+
+        return graph
+
+    def _pair_greedy(self, video_files: List[str], subtitle_files: List[str],
+                     pairs: Dict) -> Dict[str, Tuple[str, float]]:
+        """Give each new video, then each waiting video, its best free subtitle."""
+        graph = self._delta_graph(video_files, subtitle_files, pairs)
+        new_videos = [v for v in video_files if v in graph]
+        waiting_videos = [v for v in graph if v in self._video_rows]
+
+        fuzzy = {}
+        used_subtitles = {subtitle_file for subtitle_file, _ in pairs.values()}
+        for video_file in new_videos + waiting_videos:
+            best_match = None
+            best_score = 0.0
+            for subtitle_file, score in graph[video_file].items():
+                if subtitle_file not in used_subtitles and score > best_score:
+                    best_score = score
+                    best_match = subtitle_file
+            if best_match:
+                used_subtitles.add(best_match)
+                fuzzy[video_file] = (best_match, best_score)
+        return fuzzy
+
+    def _pair_optimal(self, video_files: List[str], subtitle_files: List[str],
+                      pairs: Dict) -> Dict[str, Tuple[str, float]]:
+        """Solve the new arrivals as a maximum-weight assignment."""
+        graph = self._delta_graph(video_files, subtitle_files, pairs)
+        assignment = max_weight_assignment(graph)
+        return {
+            video_file: (subtitle_file, graph[video_file][subtitle_file])
+            for video_file, subtitle_file in assignment.items()
+        }
+
+    def _apply_pairs(self, pairs: Dict[str, Tuple[str, float]],
+                     video_files: List[str], subtitle_files: List[str]) -> List[MatchRecord]:
+        """Update waiting rows in place and append rows for new files."""
+        touched = []
+        new_subtitles = set(subtitle_files)
+        paired_subtitles = set()
+
+        for video_file, (subtitle_file, confidence) in pairs.items():
+            paired_subtitles.add(subtitle_file)
+            self._video_index.remove(video_file)
+            self._subtitle_index.remove(subtitle_file)
+            self._forget_keys(video_file, subtitle_file)
+
+        # Waiting rows are completed in place
+        for video_file, (subtitle_file, confidence) in pairs.items():
+            row = self._video_rows.pop(video_file, None) or self._subtitle_rows.pop(subtitle_file, None)
+            if row is not None:
+                self._fill_row(row, video_file, subtitle_file, confidence)
+                touched.append(row)
+
+        # New files that paired with each other or found no partner get new rows
+        for video_file in video_files:
+            if video_file in pairs:
+                subtitle_file, confidence = pairs[video_file]
+                if subtitle_file in new_subtitles:
+                    row = MatchRecord()
+                    self.records.append(row)
+                    self._fill_row(row, video_file, subtitle_file, confidence)
+                    touched.append(row)
+            else:
+                self._add_waiting_row(video_file, None, self._video_rows, touched)
+        for subtitle_file in subtitle_files:
+            if subtitle_file not in paired_subtitles:
+                self._add_waiting_row(None, subtitle_file, self._subtitle_rows, touched)
+
+        return touched
+
+    def _fill_row(self, row: MatchRecord, video_file: str, subtitle_file: str,
+                  confidence: float) -> None:
+        """Turn a row into a complete video/subtitle pairing."""
+        new_name = self.file_matcher._generate_new_subtitle_name(video_file, subtitle_file)
+        row.set_pair(video_file, subtitle_file,
+                     unique_name(new_name, self._targets[video_file]), confidence)
+
+    def _add_waiting_row(self, video_file: Optional[str], subtitle_file: Optional[str],
+                         rows: Dict[str, MatchRecord], touched: List[MatchRecord]) -> None:
+        """Append a row for a file that has no partner yet."""
+        row = MatchRecord(video_file, subtitle_file)
+        self.records.append(row)
+        rows[video_file or subtitle_file] = row
+        touched.append(row)
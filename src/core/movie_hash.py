@@ -0,0 +1,160 @@
+"""
+Head/tail movie hashes and a local hash-to-subtitle index
+"""
+
+import mmap
+import os
+import struct
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from .match_cache import MatchCache, file_keys
+
+# The hash covers this many bytes at each end of the file
+HASH_CHUNK = 64 * 1024
+_WORDS = struct.Struct(f'<{HASH_CHUNK // 8}Q')
+_MASK = 0xFFFFFFFFFFFFFFFF
+
+
+def _sum_chunk(f, offset: int) -> int:
+    """Sum the 64-bit little-endian words of one chunk, mapping only that range."""
+    aligned = offset - offset % mmap.ALLOCATIONGRANULARITY
+    try:
+        with mmap.mmap(f.fileno(), offset - aligned + HASH_CHUNK,
+                       access=mmap.ACCESS_READ, offset=aligned) as view:
+            return sum(_WORDS.unpack_from(view, offset - aligned))
+    except (ValueError, OSError):
+        # Some network filesystems cannot be memory-mapped
+        f.seek(offset)
+        return sum(_WORDS.unpack(f.read(HASH_CHUNK)))
+
+
+def movie_hash(path: str) -> Optional[str]:
+    """Return the 16-digit hex head/tail hash used by subtitle sites.
+
+    The hash is the file size plus the 64-bit word sums of the first and
+    last 64KB. Files smaller than 64KB, or that cannot be read, give None.
+    """
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HASH_CHUNK:
+                return None
+            total = size + _sum_chunk(f, 0) + _sum_chunk(f, size - HASH_CHUNK)
+    except OSError:
+        return None
+    return f'{total & _MASK:016x}'
+
+
+class MovieHasher:
+    """Hashes videos on a process pool, remembering results by (path, size, mtime).
+
+    The most recently used ``memo_size`` hashes are kept in memory, so a
+    long-running watcher does not grow without bound; with a MatchCache
+    they also persist across runs, so large videos are only read once.
+    """
+
+    def __init__(self, cache: Optional[MatchCache] = None, workers: Optional[int] = None,
+                 min_pool_files: int = 4, memo_size: int = 65536):
+        self.cache = cache
+        # None uses one process per CPU
+        self.workers = workers
+        # Fewer uncached files than this are hashed in-process
+        self.min_pool_files = min_pool_files
+        self.memo_size = memo_size
+        self._known: 'OrderedDict[tuple, Optional[str]]' = OrderedDict()
+
+    def hash_files(self, paths: Iterable[str]) -> Dict[str, str]:
+        """Return the movie hash of every given file that could be hashed."""
+        keys = file_keys(paths)
+        hashes = {}
+        missing = []
+        for path, key in keys.items():
+            memo_key = (path, *key)
+            if memo_key in self._known:
+                self._known.move_to_end(memo_key)
+                hashes[path] = self._known[memo_key]
+            else:
+                missing.append(path)
+
+        if missing and self.cache is not None:
+            for path, value in self.cache.lookup_hashes({p: keys[p] for p in missing}).items():
+                hashes[path] = value
+                self._remember((path, *keys[path]), value)
+            missing = [path for path in missing if path not in hashes]
+
+        if missing:
+            computed = dict(zip(missing, self._compute(missing)))
+            for path, value in computed.items():
+                self._remember((path, *keys[path]), value)
+                hashes[path] = value
+            if self.cache is not None:
+                self.cache.store_hashes(
+                    {path: value for path, value in computed.items() if value}, keys
+                )
+
+        return {path: value for path, value in hashes.items() if value}
+
+    def _remember(self, memo_key: tuple, value: Optional[str]) -> None:
+        """Memoize a hash, forgetting the least recently used beyond memo_size."""
+        self._known[memo_key] = value
+        if len(self._known) > self.memo_size:
+            self._known.popitem(last=False)
+
+    def _compute(self, paths: List[str]) -> List[Optional[str]]:
+        """Hash files, on a process pool when there are enough of them."""
+        if len(paths) >= self.min_pool_files and self.workers != 1:
+            # multiprocessing is slow to import and only needed here
+            from concurrent.futures import ProcessPoolExecutor
+            from concurrent.futures.process import BrokenProcessPool
+            try:
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    return list(executor.map(movie_hash, paths, chunksize=8))
+            except (OSError, BrokenProcessPool):
+                # Process pools are unavailable in some sandboxes and frozen apps
+                pass
+        return [movie_hash(path) for path in paths]
+
+
+class HashIndex:
+    """Maps movie hashes to subtitle files, read from a tab-separated file.
+
+    Each line holds a hash and a subtitle path; relative paths are taken
+    relative to the index file and lines starting with '#' are ignored.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.entries: Dict[str, List[str]] = defaultdict(list)
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def load(self, path: str) -> None:
+        """Add every entry of an index file."""
+        base = os.path.dirname(os.path.abspath(path))
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if not line or line.startswith('#') or '\t' not in line:
+                    continue
+                value, subtitle_path = line.split('\t', 1)
+                self.add(value, os.path.join(base, subtitle_path))
+
+    def add(self, value: str, subtitle_path: str) -> None:
+        """Record that a subtitle belongs to videos with the given hash."""
+        subtitles = self.entries[value.lower()]
+        if subtitle_path not in subtitles:
+            subtitles.append(subtitle_path)
+
+    def lookup(self, value: str) -> List[str]:
+        """Return the subtitles recorded for a hash."""
+        return self.entries.get(value.lower(), [])
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Write the index back to disk, with paths relative to the file."""
+        path = path or self.path
+        base = os.path.dirname(os.path.abspath(path))
+        with open(path, 'w', encoding='utf-8') as f:
+            for value, subtitles in sorted(self.entries.items()):
+                for subtitle_path in subtitles:
+                    f.write(f'{value}\t{os.path.relpath(subtitle_path, base)}\n')
@@ -0,0 +1,121 @@
+"""
+Vectorized character n-gram prefilter for large candidate sets
+
+NumPy is optional: without it ``available()`` is False and callers keep
+using the inverted index in subtitle_index.
+"""
+
+import zlib
+from typing import Dict, List, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+
+from .subtitle_index import SubtitleIndex
+
+# Largest dense subtitle matrix kept in memory between video blocks
+_DENSE_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def available() -> bool:
+    """Whether NumPy is installed and the prefilter can be used."""
+    return np is not None
+
+
+class NgramPrefilter:
+    """Ranks subtitles per video by cosine similarity of hashed n-gram vectors.
+
+    Every normalized name becomes a vector of its token and character
+    trigram counts hashed into ``dimensions`` buckets. Videos and subtitles
+    are multiplied in blocks so memory stays bounded, and only the
+    ``top_k`` most similar subtitles per video are kept for exact scoring.
+    """
+
+    def __init__(self, top_k: int = 50, dimensions: int = 1024, block_size: int = 1024):
+        if np is None:
+            raise RuntimeError("NumPy is required for the n-gram prefilter")
+        self.top_k = top_k
+        self.dimensions = dimensions
+        self.block_size = block_size
+        self._buckets: Dict[str, int] = {}
+
+    def _bucket(self, feature: str) -> int:
+        """Stable hash bucket of a feature, independent of PYTHONHASHSEED."""
+        bucket = self._buckets.get(feature)
+        if bucket is None:
+            bucket = zlib.crc32(feature.encode('utf-8')) % self.dimensions
+            self._buckets[feature] = bucket
+        return bucket
+
+    def _encode(self, names: Sequence[str]):
+        """Encode names sparsely as (row offsets, bucket ids), CSR style."""
+        offsets = [0]
+        buckets: List[int] = []
+        for name in names:
+            buckets.extend(self._bucket(feature) for feature in SubtitleIndex.features(name))
+            offsets.append(len(buckets))
+        return np.asarray(offsets, dtype=np.int64), np.asarray(buckets, dtype=np.int64)
+
+    def _dense(self, encoded, start: int, stop: int):
+        """Expand rows start:stop of an encoding into L2-normalized vectors."""
+        offsets, buckets = encoded
+        lengths = np.diff(offsets[start:stop + 1])
+        rows = np.repeat(np.arange(stop - start), lengths)
+        cells = rows * self.dimensions + buckets[offsets[start]:offsets[stop]]
+        matrix = np.bincount(cells, minlength=(stop - start) * self.dimensions)
+        matrix = matrix.reshape(stop - start, self.dimensions).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def top_candidates(self, video_names: Sequence[str],
+                       subtitle_names: Sequence[str]) -> List[List[int]]:
+        """Return, per video, the positions of its most similar subtitles.
+
+        Positions refer to ``subtitle_names`` and are sorted ascending, so
+        exact scoring visits candidates in the same order a full scan would.
+        Subtitles with no n-gram in common are never returned.
+        """
+        if not video_names or not subtitle_names:
+            return [[] for _ in video_names]
+
+        videos = self._encode(video_names)
+        subtitles = self._encode(subtitle_names)
+        # Dense subtitle blocks are reused across video blocks while they fit the budget
+        if len(subtitle_names) * self.dimensions * 4 <= _DENSE_CACHE_BYTES:
+            subtitle_blocks = list(self._blocks(subtitles, len(subtitle_names)))
+        else:
+            subtitle_blocks = None
+
+        results: List[List[int]] = []
+        for start in range(0, len(video_names), self.block_size):
+            stop = min(start + self.block_size, len(video_names))
+            block = self._dense(videos, start, stop)
+            best_scores = np.zeros((stop - start, 0), dtype=np.float32)
+            best_positions = np.zeros((stop - start, 0), dtype=np.int64)
+
+            # Merge the running top-k with each block of subtitles
+            for sub_start, sub_matrix in subtitle_blocks or self._blocks(subtitles, len(subtitle_names)):
+                scores = np.concatenate((best_scores, block @ sub_matrix.T), axis=1)
+                positions = np.concatenate((
+                    best_positions,
+                    np.broadcast_to(np.arange(sub_start, sub_start + sub_matrix.shape[0]),
+                                    (stop - start, sub_matrix.shape[0]))
+                ), axis=1)
+                if scores.shape[1] > self.top_k:
+                    keep = np.argpartition(-scores, self.top_k - 1, axis=1)[:, :self.top_k]
+                    scores = np.take_along_axis(scores, keep, axis=1)
+                    positions = np.take_along_axis(positions, keep, axis=1)
+                best_scores, best_positions = scores, positions
+
+            for row in range(stop - start):
+                keep = best_positions[row][best_scores[row] > 0]
+                results.append(sorted(keep.tolist()))
+        return results
+
+    def _blocks(self, encoded, count: int):
+        """Yield (start, dense block) pairs over every row of an encoding."""
+        for start in range(0, count, self.block_size):
+            yield start, self._dense(encoded, start, min(start + self.block_size, count))
@@ -0,0 +1,219 @@
+"""
+Append-only journal of planned and completed renames, for crash recovery and undo
+"""
+
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from .match_cache import default_cache_path
+
+# Completion records are flushed to disk in batches of this many
+SYNC_EVERY = 512
+# Planned moves written per journal line
+_PLAN_CHUNK = 1024
+# Last lines of a run that was not interrupted
+_CLOSING = ('["end"]', '["undone"]')
+
+
+def default_journal_path() -> str:
+    """Return the journal location, next to the match cache."""
+    return os.path.join(os.path.dirname(default_cache_path()), 'rename_journal.jsonl')
+
+
+class RenameJournal:
+    """Records the most recent rename run in an append-only JSON-lines file.
+
+    The whole plan is written and fsynced before the first file moves.
+    Completed moves are appended as they happen but only fsynced every
+    ``sync_every`` records and at the end of the run, so a crash may lose
+    the latest few. That is safe: the plan says which moves may have
+    happened and the file system says which did (see SubtitleRenamer.recover).
+
+    Starting a run replaces the previous one, so the journal always
+    describes the last run, which is the one undo reverses. A run can be
+    extended by further batches (see ``begin``); recovery only looks at
+    the last batch, while undo reverses the whole run.
+    """
+
+    def __init__(self, path: Optional[str] = None, sync_every: int = SYNC_EVERY):
+        self.path = path or default_journal_path()
+        self.sync_every = sync_every
+        self._file = None
+        self._pending = 0
+        # Plan position of the current batch's first item
+        self._offset = 0
+        # Mode and size of the run this journal wrote last, while it may be extended
+        self._run: Optional[Tuple[str, int]] = None
+
+    def begin(self, plan: List[Tuple[str, str]], mode: str,
+              taken: Optional[Dict[int, Tuple[int, ...]]] = None,
+              append: bool = False) -> None:
+        """Start a new run and persist its plan before anything moves.
+
+        ``taken`` maps plan positions whose new name was already in use
+        to the (device, inode, size, mtime) of the file holding it, so
+        recovery can tell that file apart from one this run put there.
+
+        With ``append`` the plan is added as a further batch to the run
+        this journal started last, if that run finished, was not undone
+        since and used the same mode; otherwise a new run is started.
+        Positions passed to ``record`` stay relative to this plan.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if append and self._run is not None and self._run[0] == mode and self._ended():
+            offset = self._run[1]
+            self.resume()
+            self._write(['append', offset, len(plan)])
+        else:
+            offset = 0
+            self.close()
+            os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._write(['begin', mode, len(plan)])
+        for start in range(0, len(plan), _PLAN_CHUNK):
+            self._write(['plan', offset + start, plan[start:start + _PLAN_CHUNK]])
+        if taken:
+            self._write(['taken', [[offset + position, *identity]
+                                   for position, identity in taken.items()]])
+        self._sync()
+        if not offset:
+            _sync_directory(directory)
+        self._offset = offset
+        self._run = (mode, offset + len(plan))
+
+    def resume(self) -> None:
+        """Reopen the last run to append further records to it.
+
+        Positions passed to ``record`` are then positions in the whole run.
+        """
+        self.close()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._offset = 0
+        self._run = None
+
+    def record(self, position: int, method: str) -> None:
+        """Record that the plan item at position was carried out."""
+        # Methods are fixed identifiers, so the line needs no JSON encoding
+        self._file.write(f'["done",{self._offset + position},"{method}"]\n')
+        self._pending += 1
+        if self._pending >= self.sync_every:
+            self._sync()
+
+    def end(self) -> None:
+        """Mark the run as finished and flush everything to disk."""
+        self._close_with('end')
+
+    def mark_undone(self) -> None:
+        """Mark the last run as reversed, so it is not undone twice."""
+        self.resume()
+        self._close_with('undone')
+
+    def drop_batch(self, start: int) -> None:
+        """Forget the last batch, from plan position start, after reversing it.
+
+        The batches before it stay in the run and can still be undone.
+        """
+        self.resume()
+        self._write(['drop', start])
+        self._close_with('end')
+
+    def interrupted(self) -> bool:
+        """Whether the last run stopped before it was finished or undone.
+
+        Only the end of the file is read, so this is cheap to call before
+        every run.
+        """
+        last = self._last_line()
+        return bool(last) and last not in _CLOSING
+
+    def _ended(self) -> bool:
+        """Whether the last run finished and was not undone."""
+        return self._last_line() == _CLOSING[0]
+
+    def _last_line(self) -> str:
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - 64))
+                tail = f.read().decode('utf-8', 'replace')
+        except FileNotFoundError:
+            return ''
+        return tail.rstrip('\n').rsplit('\n', 1)[-1]
+
+    def last_run(self) -> Optional[Dict]:
+        """Read the last run back, or None when there is none.
+
+        Returns a dict with the output 'mode', the 'plan' as a list of
+        (original, new) pairs, 'done' mapping plan positions to the method
+        used, 'taken' as given to begin, 'batch_start' as the position of
+        the last batch's first item, and whether the run 'finished' and was
+        'undone'. A line torn by a crash is ignored.
+        """
+        try:
+            f = open(self.path, encoding='utf-8')
+        except FileNotFoundError:
+            return None
+        run = {'mode': 'move', 'plan': [], 'done': {}, 'taken': {}, 'batch_start': 0,
+               'finished': False, 'undone': False}
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                kind = entry[0]
+                if kind == 'done':
+                    run['done'][entry[1]] = entry[2]
+                elif kind == 'plan':
+                    run['plan'].extend(tuple(item) for item in entry[2])
+                elif kind == 'taken':
+                    run['taken'].update((item[0], tuple(item[1:])) for item in entry[1])
+                elif kind == 'begin':
+                    run['mode'] = entry[1]
+                elif kind == 'append':
+                    run['batch_start'] = entry[1]
+                    run['finished'] = False
+                elif kind == 'drop':
+                    start = run['batch_start'] = entry[1]
+                    del run['plan'][start:]
+                    for field in ('done', 'taken'):
+                        run[field] = {p: v for p, v in run[field].items() if p < start}
+                elif kind == 'end':
+                    run['finished'] = True
+                elif kind == 'undone':
+                    run['finished'] = run['undone'] = True
+        return run
+
+    def close(self) -> None:
+        """Flush and close the journal file if it is open."""
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
+
+    def _close_with(self, kind: str) -> None:
+        self._write([kind])
+        self.close()
+
+    def _write(self, entry: list) -> None:
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+
+def _sync_directory(directory: str) -> None:
+    """Persist a new directory entry; not possible, nor needed, on Windows."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -3,103 +3,490 @@ Subtitle file renaming functionality
 """
 
 import os
-import shutil
-from typing import List, Dict
-from pathlib import Path
+import threading
+from typing import Callable, List, Dict, Optional, Tuple
+
+from .dir_snapshot import DirectorySnapshot
+from .file_transfer import TRANSFER_MODES, DeviceMap, FileTransfer, same_contents, temporary_path
+from .instrumentation import instrumentation
+from .match_record import rename_plan
+from .rename_journal import RenameJournal
 
 class SubtitleRenamer:
     """Handles the actual renaming of subtitle files."""
     
-    def rename_files(self, matched_files: List[Dict]) -> List[Dict]:
-        """Rename subtitle files based on matched video files."""
-        results = []
+    MODES = TRANSFER_MODES
+    RECOVERY_POLICIES = ('resume', 'rollback')
+    # Error of items not started because the run was cancelled
+    CANCELLED_ERROR = "Cancelled"
+    
+    def __init__(self, max_workers: int = 1, workers_per_device: int = 4, mode: str = 'move',
+                 verify_copies: bool = True, journal: Optional[RenameJournal] = None,
+                 recovery: str = 'resume'):
+        # max_workers > 1 renames concurrently, which pays off on SMB/NFS mounts
+        self.max_workers = max_workers
+        # Cap on in-flight operations against any single device
+        self.workers_per_device = workers_per_device
+        # 'move' renames subtitles; 'hardlink' and 'symlink' keep the original name too
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown output mode: {mode}")
+        self.mode = mode
+        # Compare cross-device copies with their source before deleting it
+        self.verify_copies = verify_copies
+        # Optional record of the last run, for crash recovery and undo
+        self.journal = journal
+        # What to do with a run the journal shows was interrupted
+        if recovery not in self.RECOVERY_POLICIES:
+            raise ValueError(f"Unknown recovery policy: {recovery}")
+        self.recovery = recovery
+    
+    def rename_files(self, matched_files: List[Dict],
+                     snapshot: Optional[DirectorySnapshot] = None,
+                     progress: Optional[Callable[[int, int], None]] = None,
+                     should_cancel: Optional[Callable[[], bool]] = None,
+                     append_to_last_run: bool = False) -> List[Dict]:
+        """Rename subtitle files based on matched video files.
+        
+        Pass the snapshot used by validate_rename_operation to reuse its
+        directory listings instead of checking every file again. ``progress``
+        is called with (done, total) after each item; once ``should_cancel``
+        returns True, items not yet started fail with a "Cancelled" error.
+        With ``append_to_last_run`` the renames are journaled as a further
+        batch of the last run this renamer made, so one undo reverses both.
+        """
+        snapshot = snapshot or DirectorySnapshot()
+        plan = rename_plan(matched_files)
+        
+        progress = progress or (lambda done, total: None)
+        should_cancel = should_cancel or (lambda: False)
+        instrumentation.count('rename.planned', len(plan))
+        
+        # An empty run would only replace the record of the last real one
+        journal = self.journal if plan else None
+        if journal is not None:
+            if journal.interrupted():
+                # Starting a run replaces the journal, so settle the unfinished one first
+                self.recover()
+            journal.begin(plan, self.mode, self._taken_targets(plan, snapshot),
+                          append=append_to_last_run)
+        
+        def finished(position: int, result: Dict, done: int) -> None:
+            if journal is not None and result['method'] is not None:
+                journal.record(position, result['method'])
+            progress(done, len(plan))
+        
+        # Device numbers and created directories are remembered for this pass only
+        transfer = FileTransfer(self.mode, self.verify_copies)
+        try:
+            with instrumentation.stage('rename.files'):
+                results = self._rename_all(plan, snapshot, transfer, finished, should_cancel)
+        except BaseException:
+            if journal is not None:
+                # Left unfinished on purpose; the next run settles it from the file system
+                journal.close()
+            raise
+        if journal is not None:
+            journal.end()
+        return results
+    
+    def _rename_all(self, plan: List[Tuple[str, str]], snapshot: DirectorySnapshot,
+                    transfer: FileTransfer, finished: Callable[[int, Dict, int], None],
+                    should_cancel: Callable[[], bool]) -> List[Dict]:
+        """Rename every plan item, sequentially or on a thread pool.
+        
+        ``finished`` is called from the calling thread with the position,
+        result and number of items done after each attempted item.
+        """
+        if self.max_workers <= 1 or len(plan) <= 1:
+            results = []
+            for position, (original_path, new_path) in enumerate(plan):
+                if should_cancel():
+                    results.append(self._failed_result(original_path, new_path,
+                                                       self.CANCELLED_ERROR))
+                else:
+                    results.append(self._rename_one(original_path, new_path, snapshot, transfer))
+                finished(position, results[-1], len(results))
+            return results
+        
+        return self._rename_concurrently(plan, snapshot, transfer, finished, should_cancel)
+    
+    def _rename_concurrently(self, plan: List[Tuple[str, str]], snapshot: DirectorySnapshot,
+                             transfer: FileTransfer, finished: Callable[[int, Dict, int], None],
+                             should_cancel: Callable[[], bool]) -> List[Dict]:
+        """Rename on a thread pool, returning results in plan order."""
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        
+        conflicts = self._find_conflicts(plan, snapshot)
+        results: List[Optional[Dict]] = [None] * len(plan)
+        limits: Dict[object, threading.BoundedSemaphore] = {}
+        
+        def run(original_path: str, new_path: str, limit: threading.BoundedSemaphore) -> Dict:
+            with limit:
+                if should_cancel():
+                    return self._failed_result(original_path, new_path, self.CANCELLED_ERROR)
+                return self._rename_one(original_path, new_path, snapshot, transfer)
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+            for position, (original_path, new_path) in enumerate(plan):
+                if position in conflicts:
+                    results[position] = self._failed_result(original_path, new_path,
+                                                            conflicts[position])
+                    continue
+                
+                device = transfer.devices.device_of(os.path.dirname(new_path))
+                if device not in limits:
+                    limits[device] = threading.BoundedSemaphore(self.workers_per_device)
+                futures[executor.submit(run, original_path, new_path, limits[device])] = position
+            
+            done = len(plan) - len(futures)
+            for future in as_completed(futures):
+                position = futures[future]
+                results[position] = future.result()
+                done += 1
+                finished(position, results[position], done)
+        
+        return results
+    
+    def _find_conflicts(self, plan: List[Tuple[str, str]],
+                        snapshot: DirectorySnapshot) -> Dict[int, str]:
+        """Decide up front which plan items would race with another item.
+        
+        The first item targeting a path or moving a source keeps it; later
+        items reusing either, or targeting a file another item is moving
+        away, fail. Link modes leave sources in place, so only targets clash.
+        Paths are compared under the snapshot's case rules, as the file
+        system would compare them.
+        """
+        key = snapshot._key
+        conflicts = {}
+        claimed_targets = {}
+        claimed_sources = set()
+        moving_sources = {
+            key(original_path) for original_path, new_path in plan if original_path != new_path
+        } if self.mode == 'move' else set()
         
-        for match in matched_files:
-            if not match['subtitle_file'] or not match['new_subtitle_name']:
+        for position, (original_path, new_path) in enumerate(plan):
+            if original_path == new_path:
                 continue
+            source, target = key(original_path), key(new_path)
+            if source in claimed_sources and self.mode == 'move':
+                conflicts[position] = (
+                    f"Source file already renamed in this batch: {os.path.basename(original_path)}"
+                )
+            elif target in claimed_targets:
+                conflicts[position] = (
+                    f"Target file claimed by another subtitle: {os.path.basename(new_path)}"
+                )
+            elif target in moving_sources and target != source:
+                # A case-only rename moves its own source onto the target
+                conflicts[position] = (
+                    f"Target file is being renamed in the same batch: {os.path.basename(new_path)}"
+                )
+            else:
+                claimed_targets[target] = position
+                claimed_sources.add(source)
+        
+        return conflicts
+    
+    @staticmethod
+    def _failed_result(original_path: str, new_path: str, error: str) -> Dict:
+        """Describe an item that was not attempted."""
+        return {
+            'original_path': original_path,
+            'new_path': new_path,
+            'success': False,
+            'error': error,
+            'method': None
+        }
+    
+    def _rename_one(self, original_path: str, new_path: str,
+                    snapshot: DirectorySnapshot, transfer: FileTransfer) -> Dict:
+        """Rename a single subtitle file and describe the outcome."""
+        result = {
+            'original_path': original_path,
+            'new_path': new_path,
+            'success': False,
+            'error': None,
+            'method': None
+        }
+        
+        try:
+            # Check if source file exists
+            if not snapshot.exists(original_path):
+                result['error'] = "Source file not found"
+                return result
+            
+            # Check if target file already exists
+            if snapshot.exists(new_path) and not snapshot.is_same_file_name(original_path, new_path):
+                # If target exists and is different from source, ask user or skip
+                result['error'] = f"Target file already exists: {os.path.basename(new_path)}"
+                return result
+            
+            # Perform the rename
+            if original_path != new_path:
+                # Same-device moves are a single os.replace; see FileTransfer
+                result['method'] = transfer.transfer(original_path, new_path)
+                if result['method'] in ('rename', 'copy'):
+                    snapshot.record_rename(original_path, new_path)
+                else:
+                    snapshot.record_created(new_path)
+                result['success'] = True
+            else:
+                # Files are the same, mark as success
+                result['success'] = True
+            
+        except PermissionError:
+            result['error'] = "Permission denied"
+        except OSError as e:
+            result['error'] = f"OS Error: {str(e)}"
+        except Exception as e:
+            result['error'] = f"Unexpected error: {str(e)}"
+        
+        return result
+    
+    def recover(self, policy: Optional[str] = None) -> List[Dict]:
+        """Resume or roll back a run the journal shows was interrupted.
+        
+        Items the journal does not list as done are first checked against
+        the file system, since the last completion records may not have
+        reached the disk. Only the last batch of a run was interrupted, so
+        only its items are settled, finished or rolled back. Returns the
+        results of the operations carried out now, which is empty when
+        there was nothing to recover.
+        """
+        journal = self.journal
+        if journal is None or not journal.interrupted():
+            return []
+        
+        with instrumentation.stage('rename.recover'):
+            run = journal.last_run()
+            start = run['batch_start']
+            done = dict(run['done'])
+            for position in range(start, len(run['plan'])):
+                if position not in done:
+                    original_path, new_path = run['plan'][position]
+                    method = self._settle(run['mode'], original_path, new_path,
+                                          run['taken'].get(position))
+                    if method is not None:
+                        done[position] = method
             
-            original_path = match['subtitle_file']
-            new_path = match['new_subtitle_name']
+            if (policy or self.recovery) == 'rollback':
+                results = self._reverse(run['plan'], {p: m for p, m in done.items() if p >= start})
+                if start:
+                    journal.drop_batch(start)
+                else:
+                    journal.mark_undone()
+                return results
+            
+            journal.resume()
+            for position, method in done.items():
+                if position not in run['done']:
+                    journal.record(position, method)
+            transfer = FileTransfer(run['mode'], self.verify_copies)
+            snapshot = DirectorySnapshot()
+            results = []
+            for position in range(start, len(run['plan'])):
+                if position in done:
+                    continue
+                original_path, new_path = run['plan'][position]
+                result = self._rename_one(original_path, new_path, snapshot, transfer)
+                if result['method'] is not None:
+                    journal.record(position, result['method'])
+                results.append(result)
+            journal.end()
+            return results
+    
+    def undo_last_run(self) -> List[Dict]:
+        """Reverse the last run recorded in the journal in one step.
+        
+        An interrupted run is rolled back, along with the batches it
+        extended. Returns one result per reversed item, which is empty when
+        there is nothing to undo.
+        """
+        journal = self.journal
+        if journal is None:
+            return []
+        results = []
+        if journal.interrupted():
+            results = self.recover('rollback')
+        
+        with instrumentation.stage('rename.undo'):
+            run = journal.last_run()
+            if run is None or run['undone']:
+                return results
+            results.extend(self._reverse(run['plan'], run['done']))
+            journal.mark_undone()
+            return results
+    
+    @staticmethod
+    def _taken_targets(plan: List[Tuple[str, str]],
+                       snapshot: DirectorySnapshot) -> Dict[int, Tuple[int, ...]]:
+        """Identify the files already holding new names before a run starts.
+        
+        Only names the snapshot lists are stat'ed, so this costs nothing
+        for the usual plan whose new names are all free.
+        """
+        taken = {}
+        for position, (original_path, new_path) in enumerate(plan):
+            if not snapshot.exists(new_path) or snapshot.is_same_file_name(original_path, new_path):
+                continue
+            identity = _file_identity(new_path)
+            if identity is not None:
+                taken[position] = identity
+        return taken
+    
+    @staticmethod
+    def _settle(mode: str, original_path: str, new_path: str,
+                taken_by: Optional[Tuple[int, ...]] = None) -> Optional[str]:
+        """Work out from the file system whether an unrecorded item was carried out.
+        
+        Returns the method as the journal would have recorded it, or None.
+        Leftovers of an unfinished cross-device copy are removed. ``taken_by``
+        is the identity of the file that held the new name before the run;
+        while it still does, the item cannot have run.
+        """
+        try:
+            if mode == 'move' and os.path.lexists(temporary_path(new_path)):
+                os.unlink(temporary_path(new_path))
+            if taken_by is not None and _file_identity(new_path) == taken_by:
+                return None
+            if mode == 'symlink':
+                link = os.path.relpath(original_path, os.path.dirname(new_path) or os.curdir)
+                if os.path.islink(new_path) and os.readlink(new_path) == link:
+                    return 'symlink'
+                return None
+            if mode == 'hardlink':
+                if os.path.lexists(new_path) and os.path.samefile(original_path, new_path):
+                    return 'hardlink'
+                return None
             
+            if not os.path.lexists(new_path):
+                return None
+            if not os.path.lexists(original_path):
+                return 'rename'
+            # Both names exist when a cross-device move stopped before removing the
+            # source; a case-only rename shows the same file under both names
+            if not os.path.samefile(original_path, new_path) and same_contents(original_path,
+                                                                                new_path):
+                os.unlink(original_path)
+                return 'copy'
+        except OSError:
+            pass
+        return None
+    
+    def _reverse(self, plan: List[Tuple[str, str]], done: Dict[int, str]) -> List[Dict]:
+        """Put the given plan items back the way they were, last item first."""
+        transfer = FileTransfer('move', self.verify_copies)
+        results = []
+        for position in sorted(done, reverse=True):
+            original_path, new_path = plan[position]
             result = {
-                'original_path': original_path,
-                'new_path': new_path,
+                'original_path': new_path,
+                'new_path': original_path,
                 'success': False,
-                'error': None
+                'error': None,
+                'method': None
             }
-            
             try:
-                # Check if source file exists
-                if not os.path.exists(original_path):
-                    result['error'] = "Source file not found"
-                    results.append(result)
-                    continue
-                
-                # Check if target file already exists
-                if os.path.exists(new_path) and original_path != new_path:
-                    # If target exists and is different from source, ask user or skip
-                    result['error'] = f"Target file already exists: {os.path.basename(new_path)}"
-                    results.append(result)
-                    continue
-                
-                # Perform the rename
-                if original_path != new_path:
-                    # Ensure target directory exists
-                    target_dir = os.path.dirname(new_path)
-                    os.makedirs(target_dir, exist_ok=True)
-                    
-                    # Rename the file
-                    shutil.move(original_path, new_path)
-                    result['success'] = True
+                if done[position] in ('hardlink', 'symlink'):
+                    # Only remove links that still point at the original
+                    if not os.path.lexists(new_path):
+                        result['success'] = True
+                    elif (os.path.islink(new_path) if done[position] == 'symlink'
+                          else os.path.samefile(original_path, new_path)):
+                        os.unlink(new_path)
+                        result['method'] = 'unlink'
+                        result['success'] = True
+                    else:
+                        result['error'] = (
+                            f"No longer a link to the original: {os.path.basename(new_path)}"
+                        )
+                elif os.path.lexists(original_path):
+                    if os.path.lexists(new_path):
+                        result['error'] = (
+                            f"Original name is taken: {os.path.basename(original_path)}"
+                        )
+                    else:
+                        # Already moved back by an earlier, interrupted undo
+                        result['success'] = True
+                elif not os.path.lexists(new_path):
+                    result['error'] = "Renamed file not found"
                 else:
-                    # Files are the same, mark as success
+                    result['method'] = transfer.transfer(new_path, original_path)
                     result['success'] = True
-                
-            except PermissionError:
-                result['error'] = "Permission denied"
             except OSError as e:
                 result['error'] = f"OS Error: {str(e)}"
-            except Exception as e:
-                result['error'] = f"Unexpected error: {str(e)}"
-            
             results.append(result)
-        
         return results
     
-    def validate_rename_operation(self, matched_files: List[Dict]) -> Dict:
-        """Validate rename operations before executing."""
+    def validate_rename_operation(self, matched_files: List[Dict],
+                                  snapshot: Optional[DirectorySnapshot] = None) -> Dict:
+        """Validate rename operations before executing.
+        
+        Checks are answered from a DirectorySnapshot, so each involved
+        directory is listed once. Pass the same snapshot to rename_files.
+        """
+        with instrumentation.stage('rename.validate'):
+            return self._validate(matched_files, snapshot or DirectorySnapshot())
+    
+    def _validate(self, matched_files: List[Dict], snapshot: DirectorySnapshot) -> Dict:
+        """Collect errors and warnings for every planned rename."""
         validation_result = {
             'valid': True,
             'warnings': [],
             'errors': []
         }
+        unwritable_dirs = set()
+        devices = DeviceMap() if self.mode == 'hardlink' else None
         
-        for match in matched_files:
-            if not match['subtitle_file'] or not match['new_subtitle_name']:
-                continue
-            
-            original_path = match['subtitle_file']
-            new_path = match['new_subtitle_name']
-            
+        for original_path, new_path in rename_plan(matched_files):
             # Check if source exists
-            if not os.path.exists(original_path):
+            if not snapshot.exists(original_path):
                 validation_result['errors'].append(
                     f"Source file not found: {os.path.basename(original_path)}"
                 )
                 validation_result['valid'] = False
             
             # Check if target already exists
-            if os.path.exists(new_path) and original_path != new_path:
+            if snapshot.exists(new_path) and not snapshot.is_same_file_name(original_path, new_path):
                 validation_result['warnings'].append(
                     f"Target file exists and will be overwritten: {os.path.basename(new_path)}"
                 )
             
+            # Check for two subtitles renamed to the same target in this batch
+            claimed_by = snapshot.plan(original_path, new_path)
+            if claimed_by is not None:
+                validation_result['errors'].append(
+                    f"Both {os.path.basename(claimed_by)} and {os.path.basename(original_path)} "
+                    f"would be renamed to {os.path.basename(new_path)}"
+                )
+                validation_result['valid'] = False
+            
             # Check write permissions on target directory
             target_dir = os.path.dirname(new_path)
-            if not os.access(target_dir, os.W_OK):
+            if target_dir not in unwritable_dirs and not snapshot.is_writable(target_dir):
+                unwritable_dirs.add(target_dir)
                 validation_result['errors'].append(
                     f"No write permission for directory: {target_dir}"
                 )
                 validation_result['valid'] = False
+            
+            # Hard links only work within one device
+            if devices is not None and not devices.same_device(os.path.dirname(original_path),
+                                                                target_dir):
+                validation_result['errors'].append(
+                    f"Hard links cannot cross devices: {os.path.basename(original_path)}"
+                )
+                validation_result['valid'] = False
         
-        return validation_result
\ No newline at end of file
+        return validation_result
+
+
+def _file_identity(path: str) -> Optional[Tuple[int, ...]]:
+    """(device, inode, size, mtime) of a path itself, or None if it is missing."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
@@ -0,0 +1,166 @@
+"""
+Scoring of video/subtitle candidate pairs in shards on a process pool
+"""
+
+import os
+from array import array
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+from .instrumentation import instrumentation
+
+# Candidate pairs per video, as (candidate subtitles, their scores)
+ScoredCandidates = Dict[str, Tuple[List[str], Dict[str, float]]]
+
+# Matchers built in pool workers, one per use_episode_keys setting
+_worker_matchers: Dict[bool, object] = {}
+
+
+def plan_shards(video_files: List[str], candidates: Dict[str, List[str]],
+                shard_count: int) -> List[List[str]]:
+    """Split videos into about shard_count shards of similar pair counts.
+
+    Videos of one directory stay together, since they tend to share their
+    candidate subtitles, which then travel to a worker only once. Shards
+    are cut in input order, so the plan is the same on every run.
+    """
+    directories: Dict[str, List[str]] = {}
+    for video_file in video_files:
+        directories.setdefault(os.path.dirname(video_file), []).append(video_file)
+
+    total = sum(len(candidates[v]) for v in video_files)
+    target = max(1, -(-total // max(1, shard_count)))
+    shards: List[List[str]] = []
+    shard: List[str] = []
+    pairs = 0
+    for directory_videos in directories.values():
+        shard.extend(directory_videos)
+        pairs += sum(len(candidates[v]) for v in directory_videos)
+        if pairs >= target:
+            shards.append(shard)
+            shard = []
+            pairs = 0
+    if shard:
+        shards.append(shard)
+    return shards
+
+
+def _encode_shard(shard: List[str], video_names: Dict[str, str],
+                  candidates: Dict[str, List[str]], subtitle_names: Dict[str, str]) -> tuple:
+    """Pack one shard for a worker.
+
+    Every subtitle is sent once per shard with its normalized name, and
+    each video lists its candidates as positions in that table.
+    """
+    positions: Dict[str, int] = {}
+    subtitles: List[Tuple[str, str]] = []
+    rows = []
+    for video_file in shard:
+        indices = array('L')
+        for subtitle_file in candidates[video_file]:
+            position = positions.get(subtitle_file)
+            if position is None:
+                position = positions[subtitle_file] = len(subtitles)
+                subtitles.append((subtitle_file, subtitle_names[subtitle_file]))
+            indices.append(position)
+        rows.append((video_file, video_names[video_file], indices))
+    return subtitles, rows
+
+
+def _score_shard(use_episode_keys: bool, payload: tuple) -> List[array]:
+    """Score every candidate pair of one shard; runs in a pool worker."""
+    matcher = _worker_matchers.get(use_episode_keys)
+    if matcher is None:
+        from .file_matcher import FileMatcher
+        matcher = _worker_matchers[use_episode_keys] = FileMatcher(
+            use_episode_keys=use_episode_keys
+        )
+    subtitles, rows = payload
+    results = []
+    for video_file, video_name, indices in rows:
+        scores = array('d')
+        for position in indices:
+            subtitle_file, subtitle_name = subtitles[position]
+            scores.append(matcher._score_pair(video_file, video_name,
+                                              subtitle_file, subtitle_name))
+        results.append(scores)
+    return results
+
+
+class ShardedScorer:
+    """Scores many candidate pairs at once, split into shards across processes.
+
+    Scores are pure functions of the two paths and their normalized names,
+    so where a pair is scored cannot change its score. Shards are merged
+    back per video; all pairing decisions stay with the caller, which is
+    what keeps the final matches identical to a single-process run.
+
+    Use as a context manager: the pool starts with the first ``score``
+    call and is reused by later calls until the block exits.
+    """
+
+    def __init__(self, workers: int, use_episode_keys: bool = True,
+                 shards_per_worker: int = 4):
+        # With a single worker no pool is started and score returns None
+        self.workers = workers
+        self.use_episode_keys = use_episode_keys
+        # More shards than workers keep the pool busy when shards are uneven
+        self.shards_per_worker = shards_per_worker
+        self._executor = None
+        self._failed = False
+
+    def __enter__(self) -> 'ShardedScorer':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether score calls use a process pool."""
+        return self.workers > 1 and not self._failed
+
+    def score(self, video_files: List[str], video_names: Dict[str, str],
+              candidates: Dict[str, List[str]],
+              subtitle_names: Dict[str, str]) -> Optional[ScoredCandidates]:
+        """Score the candidate subtitles of every video.
+
+        Returns None when no process pool could be used, in which case
+        the caller scores pairs itself as usual.
+        """
+        if not self.enabled or not video_files:
+            return None
+        # multiprocessing is slow to import and only needed here
+        from concurrent.futures.process import BrokenProcessPool
+
+        shards = plan_shards(video_files, candidates, self.workers * self.shards_per_worker)
+        payloads = [_encode_shard(shard, video_names, candidates, subtitle_names)
+                    for shard in shards]
+        try:
+            results = list(self._pool().map(partial(_score_shard, self.use_episode_keys),
+                                             payloads))
+        except (OSError, BrokenProcessPool):
+            # Process pools are unavailable in some sandboxes and frozen apps
+            self._failed = True
+            self.close()
+            return None
+        instrumentation.count('match.score_shards', len(shards))
+
+        scored: ScoredCandidates = {}
+        for shard, shard_scores in zip(shards, results):
+            for video_file, scores in zip(shard, shard_scores):
+                selected = candidates[video_file]
+                scored[video_file] = (selected, dict(zip(selected, scores)))
+        return scored
+
+    def close(self) -> None:
+        """Shut the pool down if it was started."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
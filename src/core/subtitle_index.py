@@ -0,0 +1,154 @@
+"""
+Inverted token index for pruning subtitle candidates before similarity scoring
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+# Removed files are dropped from the postings once they outnumber this many
+# and the files still indexed
+_COMPACT_MIN_REMOVED = 1024
+
+
+class SubtitleIndex:
+    """Maps normalized tokens and character trigrams to subtitle files."""
+
+    def __init__(self, max_candidates: int = 50):
+        # Only the subtitles sharing the most features with a video are scored
+        self.max_candidates = max_candidates
+        self.postings: Dict[str, List[str]] = defaultdict(list)
+        self.names: Dict[str, str] = {}
+        self.order: Dict[str, int] = {}
+        self._next_order = 0
+        # Removed files still present in the postings
+        self._removed = 0
+        # Video name -> candidates chosen up front by a batch prefilter
+        self.preselected: Dict[str, List[str]] = {}
+        self.candidates_scored = 0
+        self.candidates_pruned = 0
+
+    @staticmethod
+    def features(name: str) -> Set[str]:
+        """Return the token and trigram features of a normalized name."""
+        features = {'t:' + token for token in name.split()}
+        padded = f' {name} '
+        features.update('g:' + padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def add(self, subtitle_file: str, normalized_name: str) -> None:
+        """Index a subtitle file under its normalized name."""
+        self.names[subtitle_file] = normalized_name
+        self.order[subtitle_file] = self._next_order
+        self._next_order += 1
+        for feature in self.features(normalized_name):
+            self.postings[feature].append(subtitle_file)
+
+    def remove(self, subtitle_file: str) -> None:
+        """Drop a subtitle from the index.
+
+        Its postings are skipped lazily and compacted away once removed
+        files outnumber the indexed ones, so lookups in a long-lived index
+        cost what its current files cost, at amortized constant time per
+        removal.
+        """
+        if self.names.pop(subtitle_file, None) is None:
+            return
+        self.order.pop(subtitle_file, None)
+        self._removed += 1
+        if self._removed > max(_COMPACT_MIN_REMOVED, len(self.names)):
+            self.compact()
+
+    def compact(self) -> None:
+        """Drop removed files from the postings and the preselected candidates."""
+        names = self.names
+        for feature in list(self.postings):
+            live = [s for s in self.postings[feature] if s in names]
+            if live:
+                self.postings[feature] = live
+            else:
+                del self.postings[feature]
+        for video_name in list(self.preselected):
+            self.preselected[video_name] = [s for s in self.preselected[video_name] if s in names]
+        self._removed = 0
+
+    def add_all(self, subtitle_files: Iterable[str], normalize) -> None:
+        """Index several subtitle files, normalizing each name once."""
+        for subtitle_file in subtitle_files:
+            self.add(subtitle_file, normalize(subtitle_file))
+
+    def preselect(self, video_names: Iterable[str], prefilter) -> None:
+        """Choose candidates for many videos at once with a batch prefilter.
+
+        ``prefilter`` is an NgramPrefilter. Later ``candidates`` calls for
+        these names only look at the preselected subtitles while none of
+        them is used; once one is taken the rest are topped up from the
+        postings.
+        """
+        video_names = list(dict.fromkeys(video_names))
+        subtitle_files = sorted(self.names, key=self.order.__getitem__)
+        ranked = prefilter.top_candidates(video_names, [self.names[s] for s in subtitle_files])
+        for video_name, positions in zip(video_names, ranked):
+            self.preselected[video_name] = [subtitle_files[position] for position in positions]
+
+    def candidates(self, video_name: str, used_subtitles: Optional[set] = None,
+                   count: bool = True) -> List[str]:
+        """Return unused subtitles sharing features with a video.
+
+        At most ``max_candidates`` subtitles with the largest feature overlap
+        are kept, returned in the order they were indexed so that score ties
+        resolve exactly as a full scan would. ``used_subtitles`` is expected
+        to hold only indexed files. With ``count=False`` the lookup is left
+        out of the scored/pruned statistics.
+        """
+        used_subtitles = used_subtitles or set()
+        preselected = [s for s in self.preselected.get(video_name, ()) if s in self.names]
+        remaining = [s for s in preselected if s not in used_subtitles]
+        if remaining and len(remaining) == len(preselected):
+            if count:
+                self._count(remaining, used_subtitles)
+            return remaining
+
+        overlap: Dict[str, int] = defaultdict(int)
+        for feature in self.features(video_name):
+            for subtitle_file in self.postings.get(feature, ()):
+                if subtitle_file in self.names:
+                    overlap[subtitle_file] += 1
+
+        ranked = [s for s in overlap if s not in used_subtitles]
+        if self.max_candidates and len(ranked) > self.max_candidates:
+            ranked.sort(key=lambda s: (-overlap[s], self.order[s]))
+            ranked = ranked[:self.max_candidates]
+        if remaining:
+            # Taken preselected candidates would otherwise leave a short list
+            ranked = set(ranked).union(remaining)
+        selected = sorted(ranked, key=self.order.__getitem__)
+        if count:
+            self._count(selected, used_subtitles)
+        return selected
+
+    def revise(self, video_name: str, selected: List[str], used_subtitles: set) -> List[str]:
+        """Return the candidates of a video given an earlier lookup.
+
+        ``selected`` is what ``candidates(video_name, earlier_used)`` returned
+        for some subset ``earlier_used`` of ``used_subtitles``. While none of
+        the selected subtitles has been used since, the answer is unchanged,
+        as using other subtitles only removes them from below the cut;
+        otherwise the lookup is repeated.
+        """
+        if any(s in used_subtitles for s in selected):
+            return self.candidates(video_name, used_subtitles)
+        self._count(selected, used_subtitles)
+        return selected
+
+    def _count(self, selected: List[str], used_subtitles: set) -> None:
+        available = len(self.names) - len(used_subtitles)
+        self.candidates_scored += len(selected)
+        self.candidates_pruned += available - len(selected)
+
+    def stats(self) -> Dict[str, int]:
+        """Return how many candidate pairs were scored versus pruned."""
+        return {
+            'subtitles_indexed': len(self.names),
+            'candidates_scored': self.candidates_scored,
+            'candidates_pruned': self.candidates_pruned,
+        }
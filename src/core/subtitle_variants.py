@@ -0,0 +1,92 @@
+"""
+Language and flag suffixes of subtitle files, and grouping of their variants
+"""
+
+import os
+from typing import Dict, List, Set, Tuple
+
+# ISO 639-1/639-2 codes and common release tags for subtitle languages
+LANGUAGE_CODES = frozenset({
+    'ar', 'ara', 'bg', 'bul', 'cs', 'cze', 'ces', 'da', 'dan', 'de', 'ger', 'deu',
+    'el', 'gre', 'ell', 'en', 'eng', 'es', 'spa', 'et', 'est', 'fa', 'per', 'fas',
+    'fi', 'fin', 'fr', 'fre', 'fra', 'he', 'heb', 'hr', 'hrv', 'hu', 'hun', 'id', 'ind',
+    'it', 'ita', 'ja', 'jp', 'jpn', 'ko', 'kor', 'lt', 'lit', 'lv', 'lav', 'ms', 'may',
+    'msa', 'nl', 'dut', 'nld', 'no', 'nor', 'nb', 'nob', 'pl', 'pol', 'pt', 'por',
+    'pt-br', 'pob', 'ro', 'rum', 'ron', 'ru', 'rus', 'sk', 'slo', 'slk', 'sl', 'slv',
+    'sr', 'srp', 'sv', 'swe', 'th', 'tha', 'tr', 'tur', 'uk', 'ukr', 'vi', 'vie',
+    'zh', 'chi', 'zho', 'chs', 'cht', 'zh-cn', 'zh-tw', 'zh-hans', 'zh-hant',
+    'und',
+})
+# Flags describing the track rather than its language
+SUBTITLE_FLAGS = frozenset({'forced', 'sdh', 'hi', 'cc', 'default', 'full'})
+# Codes and flags that are also common words in titles ("Dr.No", "It", "Full");
+# they only count with another suffix part that supports them, see split_variant
+AMBIGUOUS_PARTS = frozenset({'no', 'it', 'id', 'he', 'may', 'per', 'hi', 'full', 'default'})
+# At most this many trailing dot-separated parts are read as suffixes
+_MAX_SUFFIX_PARTS = 3
+
+
+def split_variant(file_path: str) -> Tuple[str, str, str]:
+    """Split a subtitle path into (base path, variant suffix, extension).
+
+    ``Show.S01E02.en.forced.srt`` gives ``('Show.S01E02', '.en.forced', '.srt')``
+    with the directory kept on the base. The suffix is '' when the name has
+    no language or flag parts; at least one part of the name always stays
+    in the base.
+
+    Parts in AMBIGUOUS_PARTS only count as suffixes when supported: a
+    language code when a flag follows it (``.it.forced``), a flag when a
+    language code precedes it (``.en.hi``). So ``Dr.No.srt`` and
+    ``It.en.srt`` keep their titles, at the cost of not recognizing a bare
+    ``.it`` or ``.no`` suffix.
+    """
+    stem, extension = os.path.splitext(file_path)
+    directory, name = os.path.split(stem)
+    parts = name.split('.')
+    cut = len(parts)
+    while cut > 1 and len(parts) - cut < _MAX_SUFFIX_PARTS:
+        part = parts[cut - 1].lower()
+        if part not in LANGUAGE_CODES and part not in SUBTITLE_FLAGS:
+            break
+        cut -= 1
+    # The first suffix part has no language before it, so it needs a flag after it
+    while cut < len(parts) and parts[cut].lower() in AMBIGUOUS_PARTS:
+        following = parts[cut + 1].lower() if cut + 1 < len(parts) else None
+        if parts[cut].lower() in SUBTITLE_FLAGS or following not in SUBTITLE_FLAGS:
+            cut += 1
+        else:
+            break
+    suffix = ''.join('.' + part for part in parts[cut:])
+    return os.path.join(directory, '.'.join(parts[:cut])), suffix, extension
+
+
+def group_variants(subtitle_files: List[str]) -> Tuple[List[str], Dict[str, List[str]]]:
+    """Group subtitles that differ only in language or flag suffixes.
+
+    Returns the first subtitle of every group, in input order, and a map
+    from each of those to the remaining variants of its group. Runs in a
+    single pass over the files.
+    """
+    representatives: Dict[str, str] = {}
+    followers: Dict[str, List[str]] = {}
+    for subtitle_file in subtitle_files:
+        base = split_variant(subtitle_file)[0]
+        first = representatives.setdefault(base, subtitle_file)
+        if first != subtitle_file:
+            followers.setdefault(first, []).append(subtitle_file)
+    return list(representatives.values()), followers
+
+
+def unique_name(target: str, taken: Set[str]) -> str:
+    """Return target, or target with '.2', '.3'... before the extension if taken.
+
+    ``taken`` holds case-folded paths and is updated with the returned name.
+    """
+    stem, extension = os.path.splitext(target)
+    candidate = target
+    counter = 1
+    while candidate.casefold() in taken:
+        counter += 1
+        candidate = f'{stem}.{counter}{extension}'
+    taken.add(candidate.casefold())
+    return candidate
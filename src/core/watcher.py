@@ -0,0 +1,317 @@
+"""
+Watch-folder mode: rename new subtitles as they land next to their videos
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from .dir_snapshot import DirectorySnapshot
+from .file_matcher import FileMatcher
+from .folder_scanner import FolderScanner
+from .renamer import SubtitleRenamer
+
+# Directory -> names of files that appeared in it, or None when unknown
+Changes = Dict[str, Optional[Set[str]]]
+
+# inotify(7) constants
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (_IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+               | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _merge(changes: Changes, directory: str, names: Optional[Set[str]]) -> None:
+    """Record new names for a directory; None (unknown) absorbs everything."""
+    if names is None or changes.get(directory, set()) is None:
+        changes[directory] = None
+    else:
+        changes.setdefault(directory, set()).update(names)
+
+
+class PollingWatcher:
+    """Detects changes by comparing directory modification times.
+
+    Only directories are stat'ed on each pass, so the cost follows the number
+    of folders rather than the number of files they hold.
+    """
+
+    def __init__(self, roots: Iterable[str], scanner: FolderScanner, interval: float = 10.0):
+        self.scanner = scanner
+        self.interval = interval
+        self._mtimes: Dict[str, int] = {}
+        self._next_poll = 0.0
+        for root in roots:
+            self._track(root)
+
+    def _track(self, root: str) -> List[str]:
+        """Start tracking a directory tree and return the directories added."""
+        added = []
+        for directory in self.scanner.directories(root):
+            try:
+                self._mtimes[directory] = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            added.append(directory)
+        return added
+
+    def poll(self, timeout: float) -> Changes:
+        """Wait up to timeout seconds and return the directories that changed."""
+        wait = max(0.0, self._next_poll - time.monotonic())
+        if wait > timeout:
+            time.sleep(timeout)
+            return {}
+        time.sleep(wait)
+        self._next_poll = time.monotonic() + self.interval
+
+        changes: Changes = {}
+        for directory, mtime in list(self._mtimes.items()):
+            try:
+                current = os.stat(directory).st_mtime_ns
+            except OSError:
+                del self._mtimes[directory]
+                continue
+            if current == mtime:
+                continue
+            self._mtimes[directory] = current
+            changes[directory] = None
+            # Pick up folders created since the last pass
+            for entry in self._subdirectories(directory):
+                if entry not in self._mtimes:
+                    for added in self._track(entry):
+                        changes[added] = None
+        return changes
+
+    def _subdirectories(self, directory: str) -> Iterator[str]:
+        """Yield the immediate, non-ignored subfolders of a directory."""
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False) and not self.scanner.is_ignored(entry.name):
+                        yield entry.path
+        except OSError:
+            return
+
+    def close(self) -> None:
+        """Stop tracking every directory."""
+        self._mtimes.clear()
+
+
+class InotifyWatcher:
+    """Linux inotify watcher with one watch per directory."""
+
+    def __init__(self, roots: Iterable[str], scanner: FolderScanner):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, 'inotify is only available on Linux')
+        self.scanner = scanner
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self._paths: Dict[int, str] = {}
+        self._roots = list(roots)
+        try:
+            for root in self._roots:
+                self._track(root)
+        except OSError:
+            self.close()
+            raise
+
+    def _track(self, root: str) -> List[str]:
+        """Add watches for a directory tree and return the directories added.
+
+        Raises OSError (ENOSPC) when the kernel watch limit is reached so the
+        caller can fall back to polling.
+        """
+        added = []
+        for directory in self.scanner.directories(root):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error in (errno.ENOENT, errno.EACCES, errno.ENOTDIR):
+                    continue
+                raise OSError(error, os.strerror(error), directory)
+            self._paths[wd] = directory
+            added.append(directory)
+        return added
+
+    def poll(self, timeout: float) -> Changes:
+        """Wait up to timeout seconds and return the directories that changed."""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return {}
+
+        changes: Changes = {}
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                self._handle(wd, mask, name, changes)
+        return changes
+
+    def _handle(self, wd: int, mask: int, name: str, changes: Changes) -> None:
+        """Translate one inotify event into directory changes."""
+        if mask & _IN_Q_OVERFLOW:
+            # Events were lost; every watched directory may hold new files
+            for directory in self._paths.values():
+                changes[directory] = None
+            return
+        directory = self._paths.get(wd)
+        if directory is None:
+            return
+        if mask & (_IN_IGNORED | _IN_DELETE_SELF | _IN_MOVE_SELF):
+            self._paths.pop(wd, None)
+            return
+        if mask & _IN_ISDIR:
+            if mask & (_IN_CREATE | _IN_MOVED_TO) and not self.scanner.is_ignored(name):
+                # Files may land before the watch exists, so treat them all as new
+                try:
+                    added = self._track(os.path.join(directory, name))
+                except OSError:
+                    # Out of watches; the folder is still processed once
+                    added = [os.path.join(directory, name)]
+                for subdirectory in added:
+                    changes[subdirectory] = None
+            return
+        if mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO):
+            # Partial downloads, artwork and .nfo files must not delay matching
+            if self.scanner.is_supported(name) and not self.scanner.is_ignored(name):
+                _merge(changes, directory, {name})
+
+    def close(self) -> None:
+        """Release the inotify file descriptor and all watches."""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+        self._paths.clear()
+
+
+class WatchDaemon:
+    """Renames subtitles that appear in watched folders.
+
+    Bursts of events are debounced per directory; once a directory has been
+    quiet for ``debounce`` seconds only that directory is matched, and only
+    pairs involving newly appeared files are applied. Activity elsewhere in
+    the tree does not hold it back.
+    """
+
+    def __init__(self, roots: List[str], file_matcher: FileMatcher, renamer: SubtitleRenamer,
+                 scanner: FolderScanner, apply: bool = True, min_confidence: float = 0.8,
+                 debounce: float = 2.0, poll_interval: float = 10.0, use_inotify: bool = True):
+        self.roots = roots
+        self.file_matcher = file_matcher
+        self.renamer = renamer
+        self.scanner = scanner
+        self.apply = apply
+        self.min_confidence = min_confidence
+        self.debounce = debounce
+        self.watcher = None
+        if use_inotify:
+            try:
+                self.watcher = InotifyWatcher(roots, scanner)
+            except OSError:
+                self.watcher = None
+        if self.watcher is None:
+            self.watcher = PollingWatcher(roots, scanner, poll_interval)
+        self._since: Dict[str, float] = {}
+        self._stopped = False
+
+    def stop(self) -> None:
+        """Make run() return after the current cycle."""
+        self._stopped = True
+
+    def run(self, on_result: Callable[[Dict], None]) -> None:
+        """Watch until stopped, reporting every plan entry and rename result."""
+        pending: Changes = {}
+        # Directory -> monotonic time of its latest event
+        last_event: Dict[str, float] = {}
+        started = time.time()
+        try:
+            while not self._stopped:
+                changes = self.watcher.poll(timeout=min(self.debounce, 1.0))
+                now = time.monotonic()
+                for directory, names in changes.items():
+                    _merge(pending, directory, names)
+                    self._since.setdefault(directory, started)
+                    last_event[directory] = now
+                quiet = [directory for directory in pending
+                         if now - last_event[directory] >= self.debounce]
+                for directory in quiet:
+                    names = pending.pop(directory)
+                    del last_event[directory]
+                    self.process_directory(directory, names, on_result)
+        finally:
+            self.watcher.close()
+
+    def process_directory(self, directory: str, names: Optional[Set[str]],
+                          on_result: Callable[[Dict], None]) -> List[Dict]:
+        """Match one directory and rename pairs that involve new files."""
+        since = self._since.pop(directory, 0.0)
+        self._since[directory] = time.time()
+        files = []
+        new_files = set()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if not entry.is_file() or not self.scanner.is_supported(entry.name):
+                        continue
+                    if self.scanner.is_ignored(entry.name):
+                        continue
+                    files.append(entry.path)
+                    if names is not None:
+                        if entry.name in names:
+                            new_files.add(entry.path)
+                    elif entry.stat().st_ctime >= since:
+                        new_files.add(entry.path)
+        except OSError:
+            return []
+        if not new_files:
+            return []
+
+        accepted = []
+        for match in self.file_matcher.match_files(sorted(files), verified=True):
+            video_file, subtitle_file = match.video_file, match.subtitle_file
+            if not video_file or not subtitle_file:
+                continue
+            if video_file not in new_files and subtitle_file not in new_files:
+                continue
+            if subtitle_file == match.new_subtitle_name:
+                continue
+            if match.confidence < self.min_confidence:
+                on_result(dict(match, type='match', action='skip'))
+                continue
+            on_result(dict(match, type='match', action='rename'))
+            accepted.append(match)
+
+        if not self.apply or not accepted:
+            return []
+        # Batches of one watch session form one run, so --undo reverses all of them
+        results = self.renamer.rename_files(accepted, DirectorySnapshot(),
+                                            append_to_last_run=True)
+        for result in results:
+            on_result(dict(result, type='result'))
+        return results
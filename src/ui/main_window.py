@@ -5,16 +5,28 @@ Main window UI for SubRenamer application
 import tkinter as tk
 from tkinter import ttk
 from tkinterdnd2 import DND_FILES, TkinterDnD
-from typing import List, Dict
-import os
+from typing import List, Dict, Optional, Tuple
+
+from ..core.instrumentation import instrumentation
+from ..core.match_record import MatchRecord
 
 class MainWindow:
     """Main window class handling the UI."""
     
+    ROW_HEIGHT = 24
+    # Above this many rows only the visible window of rows is rendered
+    VIRTUAL_THRESHOLD = 5000
+    
     def __init__(self, root: tk.Tk, app):
         self.root = root
         self.app = app
         
+        # Rows currently in the tree: item ID -> (values, tag)
+        self._rendered: Dict[str, Tuple[Tuple[str, str, str], str]] = {}
+        self._matched_files: List[Dict] = []
+        self._virtual = False
+        self._window_start = 0
+        
         self.setup_ui()
         self.setup_drag_drop()
     
@@ -31,7 +43,7 @@ class MainWindow:
         main_frame.rowconfigure(1, weight=1)
         
         # Title label
-        title_label = ttk.Label(main_frame, text="Drag & Drop Video and Subtitle Files", 
+        title_label = ttk.Label(main_frame, text="Drag & Drop Video and Subtitle Files or Folders", 
                                font=("Arial", 12, "bold"))
         title_label.grid(row=0, column=0, pady=(0, 10), sticky=tk.W)
         
@@ -43,7 +55,7 @@ class MainWindow:
         
         # Configure treeview style for better appearance
         style = ttk.Style()
-        style.configure("Custom.Treeview", rowheight=24)  # Add row padding
+        style.configure("Custom.Treeview", rowheight=self.ROW_HEIGHT)  # Add row padding
         style.configure("Custom.Treeview.Heading", font=("Arial", 10, "bold"))
         style.configure("Custom.Treeview.Cell", padding=(10, 0, 10, 0))
         
@@ -66,31 +78,55 @@ class MainWindow:
         self.tree.column("new_subtitle", width=250, minwidth=150, stretch=False)
         
         # Add scrollbars
-        v_scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.v_scrollbar = v_scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.tree.yview)
         h_scrollbar = ttk.Scrollbar(list_frame, orient=tk.HORIZONTAL, command=self.tree.xview)
         self.tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
         
+        # Scrolling in virtual mode moves the rendered window instead of the tree
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tree.bind(sequence, self._on_virtual_wheel)
+        self.tree.bind("<Configure>", lambda event: self._virtual and self._render_window())
+        
         # Grid the treeview and scrollbars
         self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         v_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
         h_scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
         
         # Drop zone label (shown when empty)
-        self.drop_label = ttk.Label(self.tree, text="Drop video and subtitle files here",
+        self.drop_label = ttk.Label(self.tree, text="Drop video and subtitle files or folders here",
                                    font=("Arial", 14), foreground="gray")
         
+        # Status frame with progress of background jobs (hidden when idle)
+        status_frame = ttk.Frame(main_frame)
+        status_frame.grid(row=2, column=0, sticky=(tk.W,), pady=(10, 0))
+        
+        self.progress_bar = ttk.Progressbar(status_frame, length=200, mode="determinate")
+        self.progress_bar.grid(row=0, column=0, padx=(0, 10))
+        self.status_label = ttk.Label(status_frame, text="")
+        self.status_label.grid(row=0, column=1)
+        self.progress_bar.grid_remove()
+        
         # Button frame
         button_frame = ttk.Frame(main_frame)
         button_frame.grid(row=2, column=0, sticky=(tk.E,), pady=(10, 0))
         
         # Buttons
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", 
+                                       command=self.app.cancel_job)
+        self.cancel_button.grid(row=0, column=0, padx=(0, 10))
+        self.cancel_button.grid_remove()
+        
+        self.undo_button = ttk.Button(button_frame, text="Undo Last Rename",
+                                     command=self.app.undo_last_rename)
+        self.undo_button.grid(row=0, column=1, padx=(0, 10))
+        
         self.clear_button = ttk.Button(button_frame, text="Clear List", 
                                       command=self.app.clear_files)
-        self.clear_button.grid(row=0, column=0, padx=(0, 10))
+        self.clear_button.grid(row=0, column=2, padx=(0, 10))
         
         self.submit_button = ttk.Button(button_frame, text="Submit", 
                                        command=self.app.process_rename)
-        self.submit_button.grid(row=0, column=1)
+        self.submit_button.grid(row=0, column=3)
         
         # Initially show drop label
         self.show_drop_label()
@@ -107,22 +143,9 @@ class MainWindow:
     def on_drop(self, event):
         """Handle file drop events."""
         files = self.root.tk.splitlist(event.data)
-        # Filter for supported file types
-        supported_files = []
-        for file_path in files:
-            if os.path.isfile(file_path):
-                ext = os.path.splitext(file_path)[1].lower()
-                # Video extensions
-                video_exts = {'.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', 
-                             '.m4v', '.mpg', '.mpeg', '.3gp', '.ts', '.mts'}
-                # Subtitle extensions
-                subtitle_exts = {'.srt', '.ass', '.ssa', '.sub', '.vtt', '.sbv', '.dfxp'}
-                
-                if ext in video_exts or ext in subtitle_exts:
-                    supported_files.append(file_path)
-        
-        if supported_files:
-            self.app.add_files(supported_files)
+        # Files and folders are filtered by the app's folder scanner
+        if files:
+            self.app.add_files(list(files))
     
     def show_drop_label(self):
         """Show the drop zone label when the list is empty."""
@@ -132,24 +155,182 @@ class MainWindow:
         """Hide the drop zone label when files are present."""
         self.drop_label.place_forget()
     
-    def update_file_list(self, matched_files: List[Dict]):
-        """Update the file list display."""
-        # Clear existing items
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+    def set_busy(self, busy: bool):
+        """Disable editing while a background job runs and show its progress."""
+        state = tk.DISABLED if busy else tk.NORMAL
+        self.submit_button.configure(state=state)
+        self.clear_button.configure(state=state)
+        self.undo_button.configure(state=state)
+        
+        if busy:
+            self.cancel_button.configure(state=tk.NORMAL)
+            self.cancel_button.grid()
+            self.progress_bar.grid()
+        else:
+            self.cancel_button.grid_remove()
+            self.progress_bar.stop()
+            self.progress_bar.grid_remove()
+            self.status_label.configure(text="")
+    
+    def show_progress(self, done: int, total: int, message: str):
+        """Show the progress of the running job; a total of 0 means unknown."""
+        if total:
+            self.progress_bar.stop()
+            self.progress_bar.configure(mode="determinate", maximum=total, value=done)
+        elif str(self.progress_bar.cget("mode")) != "indeterminate":
+            self.progress_bar.configure(mode="indeterminate")
+            self.progress_bar.start(20)
+        self.status_label.configure(text=message)
+    
+    def show_cancelling(self):
+        """Indicate that cancellation was requested."""
+        self.cancel_button.configure(state=tk.DISABLED)
+        self.status_label.configure(text="Cancelling...")
+    
+    def update_file_list(self, matched_files: List[Dict], touched: Optional[List[Dict]] = None):
+        """Update the file list display.
+        
+        Rows keep stable item IDs and only inserts, updates and deletes are
+        sent to the tree. ``touched`` may list the rows changed since the last
+        call when rows are only ever appended or updated in place, which
+        avoids diffing the whole list.
+        """
+        with instrumentation.stage('ui.update_file_list'):
+            self._update_file_list(matched_files, touched)
+        instrumentation.count('ui.rows', len(matched_files))
+    
+    def _update_file_list(self, matched_files: List[Dict], touched: Optional[List[Dict]]):
+        """Bring the tree in line with matched_files."""
+        self._matched_files = matched_files
         
         if not matched_files:
+            if self._rendered:
+                instrumentation.count('ui.rows_deleted', len(self._rendered))
+                self.tree.delete(*self._rendered)
+                self._rendered.clear()
+            self._set_virtual(False)
             self.show_drop_label()
             return
         
         self.hide_drop_label()
         
-        # Add matched files to the tree with alternating row colors
-        for index, match in enumerate(matched_files):
-            video_name = os.path.basename(match['video_file']) if match['video_file'] else ""
-            original_sub = os.path.basename(match['subtitle_file']) if match['subtitle_file'] else ""
-            new_sub = os.path.basename(match['new_subtitle_name']) if match['new_subtitle_name'] else ""
-            
+        if len(matched_files) > self.VIRTUAL_THRESHOLD:
+            self._set_virtual(True)
+            self._render_window()
+        elif self._virtual:
+            self._set_virtual(False)
+            self._apply_diff(matched_files)
+        elif touched is not None and self._rendered:
+            self._apply_touched(touched)
+        else:
+            self._apply_diff(matched_files)
+    
+    @staticmethod
+    def _item_id(match: MatchRecord) -> str:
+        """Stable tree item ID for a match record."""
+        return f"row{match.row_id}"
+    
+    @staticmethod
+    def _row_values(match: MatchRecord) -> Tuple[str, str, str]:
+        """Column values displayed for a match record."""
+        return (match.video_basename or "", match.subtitle_basename or "",
+                match.new_subtitle_basename or "")
+    
+    def _apply_diff(self, rows: List[Dict], first_index: int = 0):
+        """Make the tree show exactly the given rows, touching only what changed."""
+        wanted = {}
+        for offset, match in enumerate(rows):
             # Apply alternating row colors for visual separation
+            index = first_index + offset
             tag = 'evenrow' if index % 2 == 0 else 'oddrow'
-            self.tree.insert("", tk.END, values=(video_name, original_sub, new_sub), tags=(tag,))
\ No newline at end of file
+            wanted[self._item_id(match)] = (self._row_values(match), tag)
+        
+        stale = [item for item in self._rendered if item not in wanted]
+        if stale:
+            self.tree.delete(*stale)
+            for item in stale:
+                del self._rendered[item]
+        
+        inserted = updated = 0
+        for position, (item, row) in enumerate(wanted.items()):
+            current = self._rendered.get(item)
+            if current is None:
+                self.tree.insert("", position, iid=item, values=row[0], tags=(row[1],))
+                inserted += 1
+            elif current != row:
+                self.tree.item(item, values=row[0], tags=(row[1],))
+                updated += 1
+            self._rendered[item] = row
+        
+        instrumentation.count('ui.rows_deleted', len(stale))
+        instrumentation.count('ui.rows_inserted', inserted)
+        instrumentation.count('ui.rows_updated', updated)
+    
+    def _apply_touched(self, touched: List[Dict]):
+        """Update changed rows in place and append new ones at the end."""
+        inserted = updated = 0
+        for match in touched:
+            item = self._item_id(match)
+            values = self._row_values(match)
+            current = self._rendered.get(item)
+            if current is None:
+                tag = 'evenrow' if len(self._rendered) % 2 == 0 else 'oddrow'
+                self.tree.insert("", tk.END, iid=item, values=values, tags=(tag,))
+                self._rendered[item] = (values, tag)
+                inserted += 1
+            elif current[0] != values:
+                self.tree.item(item, values=values)
+                self._rendered[item] = (values, current[1])
+                updated += 1
+        
+        instrumentation.count('ui.rows_inserted', inserted)
+        instrumentation.count('ui.rows_updated', updated)
+    
+    def _set_virtual(self, virtual: bool):
+        """Switch the vertical scrollbar between the tree and the row window."""
+        if virtual == self._virtual:
+            return
+        self._virtual = virtual
+        self._window_start = 0
+        if virtual:
+            self.tree.configure(yscrollcommand="")
+            self.v_scrollbar.configure(command=self._on_virtual_scroll)
+        else:
+            self.tree.configure(yscrollcommand=self.v_scrollbar.set)
+            self.v_scrollbar.configure(command=self.tree.yview)
+    
+    def _visible_row_count(self) -> int:
+        """Number of rows that fit in the tree at its current size."""
+        height = self.tree.winfo_height() // self.ROW_HEIGHT
+        return max(int(self.tree.cget("height")), height)
+    
+    def _render_window(self):
+        """Render only the rows inside the visible window."""
+        total = len(self._matched_files)
+        page = self._visible_row_count()
+        self._window_start = max(0, min(self._window_start, total - page))
+        end = min(total, self._window_start + page)
+        
+        self._apply_diff(self._matched_files[self._window_start:end], self._window_start)
+        if total:
+            self.v_scrollbar.set(self._window_start / total, end / total)
+    
+    def _on_virtual_scroll(self, *args):
+        """Handle scrollbar commands while in virtual mode."""
+        if args[0] == "moveto":
+            self._window_start = int(float(args[1]) * len(self._matched_files))
+        elif args[0] == "scroll":
+            step = self._visible_row_count() if args[2] == "pages" else 1
+            self._window_start += int(args[1]) * step
+        self._render_window()
+    
+    def _on_virtual_wheel(self, event):
+        """Scroll the row window with the mouse wheel while in virtual mode."""
+        if not self._virtual:
+            return None
+        if event.num == 5 or getattr(event, "delta", 0) < 0:
+            self._window_start += 3
+        else:
+            self._window_start -= 3
+        self._render_window()
+        return "break"
@@ -0,0 +1,27 @@
+"""
+Tests for file name normalization
+"""
+
+import unittest
+
+from src.core.name_normalizer import NameNormalizer
+
+
+class NameNormalizerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.normalizer = NameNormalizer()
+
+    def test_year_titles_and_resolutions_survive(self):
+        self.assertEqual(self.normalizer.normalize('1917.2019.1080p.BluRay'), '1917 1080p bluray')
+        self.assertEqual(self.normalizer.normalize('[Group] 1917 (2019)'), '1917')
+
+    def test_release_years_are_dropped(self):
+        self.assertEqual(self.normalizer.normalize('Movie.Name.2019.720p'), 'movie name 720p')
+
+    def test_long_numbers_are_kept(self):
+        self.assertEqual(self.normalizer.normalize('Show.S01E01.12345'), 'show s01e01 12345')
+
+
+if __name__ == '__main__':
+    unittest.main()
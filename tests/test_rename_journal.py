@@ -0,0 +1,73 @@
+"""
+Tests for the rename journal, recovery and undo
+"""
+
+import os
+import tempfile
+import unittest
+
+from src.core.rename_journal import RenameJournal
+from src.core.renamer import SubtitleRenamer
+
+
+class AppendedBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = self._directory.name
+        self.journal = RenameJournal(os.path.join(self.directory, 'journal.jsonl'))
+        self.renamer = SubtitleRenamer(journal=self.journal)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _batch(self, *names: str) -> list:
+        matches = []
+        for name in names:
+            open(self._path(name + '.txt.srt'), 'w').close()
+            matches.append({'video_file': self._path(name + '.mkv'),
+                            'subtitle_file': self._path(name + '.txt.srt'),
+                            'new_subtitle_name': self._path(name + '.srt'),
+                            'confidence': 1.0})
+        return matches
+
+    def test_undo_reverses_every_appended_batch(self):
+        self.renamer.rename_files(self._batch('a'), append_to_last_run=True)
+        self.renamer.rename_files(self._batch('b', 'c'), append_to_last_run=True)
+
+        results = self.renamer.undo_last_run()
+
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(result['success'] for result in results))
+        for name in ('a', 'b', 'c'):
+            self.assertTrue(os.path.exists(self._path(name + '.txt.srt')))
+            self.assertFalse(os.path.exists(self._path(name + '.srt')))
+
+    def test_without_append_a_run_replaces_the_last_one(self):
+        self.renamer.rename_files(self._batch('a'))
+        self.renamer.rename_files(self._batch('b'))
+
+        self.assertEqual(len(self.renamer.undo_last_run()), 1)
+        self.assertTrue(os.path.exists(self._path('a.srt')))
+
+    def test_rollback_of_an_interrupted_batch_keeps_earlier_batches(self):
+        self.renamer.rename_files(self._batch('a'), append_to_last_run=True)
+        batch = self._batch('b')
+        plan = [(batch[0]['subtitle_file'], batch[0]['new_subtitle_name'])]
+        self.journal.begin(plan, 'move', append=True)
+        os.replace(*plan[0])
+        self.journal.close()
+
+        recovered = self.renamer.recover('rollback')
+
+        self.assertEqual([r['new_path'] for r in recovered], [self._path('b.txt.srt')])
+        self.assertTrue(os.path.exists(self._path('a.srt')))
+        self.assertEqual(len(self.renamer.undo_last_run()), 1)
+        self.assertTrue(os.path.exists(self._path('a.txt.srt')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+"""
+Tests for subtitle renaming
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src.core.renamer import SubtitleRenamer
+
+
+class ConcurrentConflictTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = self._directory.name
+        for name in ('a.srt', 'b.srt'):
+            with open(os.path.join(self.directory, name), 'w') as f:
+                f.write(name)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _match(self, subtitle: str, target: str) -> dict:
+        return {'video_file': os.path.join(self.directory, target + '.mkv'),
+                'subtitle_file': os.path.join(self.directory, subtitle),
+                'new_subtitle_name': os.path.join(self.directory, target + '.srt'),
+                'confidence': 1.0}
+
+    def test_targets_differing_only_in_case_conflict_on_case_insensitive_platforms(self):
+        renamer = SubtitleRenamer(max_workers=4)
+        with mock.patch('sys.platform', 'darwin'):
+            results = renamer.rename_files([self._match('a.srt', 'Movie'),
+                                            self._match('b.srt', 'movie')])
+        self.assertTrue(results[0]['success'])
+        self.assertFalse(results[1]['success'])
+        self.assertIn('claimed by another subtitle', results[1]['error'])
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'b.srt')))
+
+    def test_case_only_rename_is_not_a_conflict(self):
+        renamer = SubtitleRenamer(max_workers=4)
+        with mock.patch('sys.platform', 'darwin'):
+            results = renamer.rename_files([self._match('a.srt', 'A'),
+                                            self._match('b.srt', 'Movie')])
+        self.assertTrue(all(result['success'] for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()